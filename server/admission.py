@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+
+from metrics import ADMISSION_QUEUE_DELAY, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED
+
+# Контроль допуска: соединения пула выдаются по приоритету, ожидание ограничено,
+# а при перегрузке запросы сразу получают 503 вместо бесконечной очереди
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# Максимальное ожидание соединения запросом класса critical, секунды; остальным — доля
+ADMISSION_ACQUIRE_TIMEOUT = float(os.getenv("ADMISSION_ACQUIRE_TIMEOUT", "2"))
+# Длина очереди за соединением, при которой отклоняются и запросы класса critical
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Заголовок Retry-After в ответах 503, секунды
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Классы приоритета: меньше — раньше получает соединение
+PRIORITIES = {
+    "critical": 0,
+    "normal": 1,
+    "background": 2,
+}
+
+# Доля очереди и времени ожидания, доступная классу: фоновые запросы
+# отклоняются первыми, записи — последними
+PRIORITY_SHARE = {
+    "critical": 1.0,
+    "normal": 0.5,
+    "background": 0.25,
+}
+
+# Маршруты с классом не по методу: тяжёлые чтения и пакетная загрузка.
+# None — маршрут не обращается к пулу и не ограничивается (служебные, метрики)
+ROUTE_PRIORITIES = {
+    "/": None,
+    "/metrics": None,
+    "/cache/stats": None,
+    "/scheduler/stats": None,
+    "/push/stats": None,
+    "/replicas/stats": None,
+    "/writes/stats": None,
+    "/transactions/stats/{user_id}": "background",
+    "/transactions/archive/": "background",
+    "/goals/forecast/{user_id}": "background",
+    "/pet/hungry": "background",
+    "/leaderboard": "background",
+    "/leaderboard/{user_id}": "background",
+    "/export/{table}": "background",
+    "/expenses/batch": "normal",
+    "/incomes/batch": "normal",
+}
+
+# Класс текущего HTTP-запроса; вне запросов (планировщик) — None: без тайм-аута, в конце очереди
+request_priority: ContextVar = ContextVar("request_priority", default=None)
+
+
+def route_priority(method: str, route: str):
+    """Класс запроса: записи (в т.ч. кормление питомца) — critical, чтения — normal"""
+    if route in ROUTE_PRIORITIES:
+        return ROUTE_PRIORITIES[route]
+    return "normal" if method in ("GET", "HEAD", "OPTIONS") else "critical"
+
+
+def overloaded(priority: str, reason: str) -> HTTPException:
+    ADMISSION_REJECTED.inc((priority, reason))
+    return HTTPException(
+        status_code=503,
+        detail="Сервер перегружен, повторите запрос позже",
+        headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+    )
+
+
+class PriorityGate:
+    """Выдача соединений пула по приоритету.
+
+    Пропускает к пулу не больше capacity запросов, поэтому очередь asyncpg
+    не образуется; освободившееся соединение достаётся ожидающему с наивысшим
+    приоритетом, при равном — пришедшему раньше.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.waiters = []
+        self._seq = itertools.count()
+
+    def _live(self):
+        return [waiter for waiter in self.waiters if not waiter[3].done()]
+
+    def depth(self, priority: str = None) -> int:
+        rank = PRIORITIES.get(priority)
+        return sum(1 for waiter in self._live() if rank is None or waiter[0] <= rank)
+
+    def delay(self) -> float:
+        """Ожидание самого старого запроса в очереди (0, если очереди нет)"""
+        started = [waiter[2] for waiter in self._live()]
+        return time.monotonic() - min(started) if started else 0.0
+
+    def check(self, priority: str):
+        """Быстрый отказ до начала работы, если класс уже не дождётся соединения"""
+        share = PRIORITY_SHARE[priority]
+        # Очередь считается с учётом более важных классов: их обслужат раньше
+        if self.depth(priority) >= ADMISSION_MAX_QUEUE * share:
+            raise overloaded(priority, "queue")
+        if self.delay() >= ADMISSION_ACQUIRE_TIMEOUT * share:
+            raise overloaded(priority, "delay")
+
+    async def enter(self, priority: str = None):
+        if self.in_use < self.capacity and not self._live():
+            # В очереди остались только отменённые и не дождавшиеся
+            self.waiters.clear()
+            self.in_use += 1
+            return
+
+        rank = PRIORITIES[priority] if priority else len(PRIORITIES)
+        timeout = ADMISSION_ACQUIRE_TIMEOUT * PRIORITY_SHARE[priority] if priority else None
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (rank, next(self._seq), time.monotonic(), future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Соединение передали одновременно с тайм-аутом: отдаём его следующему
+                self.leave()
+            if isinstance(e, asyncio.TimeoutError):
+                raise overloaded(priority, "timeout")
+            raise
+
+    def leave(self):
+        while self.waiters:
+            future = heapq.heappop(self.waiters)[3]
+            if not future.done():
+                # Место переходит ожидающему, in_use не меняется
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+    def collect(self):
+        live = self._live()
+        for priority, rank in PRIORITIES.items():
+            ADMISSION_QUEUE_DEPTH.set((priority,), sum(1 for waiter in live if waiter[0] == rank))
+        ADMISSION_QUEUE_DELAY.set((), round(self.delay(), 3))
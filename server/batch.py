@@ -0,0 +1,202 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from pydantic import ValidationError
+
+from groupcommit import lock_user_writes
+from pet_state import EXPENSE_ENERGY, INCOME_ENERGY, energy_update_sql
+from scheduler import months_elapsed_sql
+
+# Максимальное число элементов в одном пакете
+MAX_BATCH_SIZE = 10000
+
+USER_NOT_FOUND = "Пользователь не найден"
+INSUFFICIENT_FUNDS = "Недостаточно средств"
+
+CENT = Decimal("0.01")
+
+
+def to_money(amount: float) -> Decimal:
+    """Сумма из запроса в точное значение с копейками, как NUMERIC(14,2) в базе"""
+    return Decimal(repr(amount)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def validate_batch(model, items: list):
+    """Поштучная валидация пакета: ошибка в одном элементе не отменяет остальные"""
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, model.model_validate(item)))
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            errors.append({"index": index, "detail": detail})
+    return valid, errors
+
+
+async def _lock_users(conn, user_ids):
+    # Сначала advisory lock записи, как у очереди UserWriteQueue, затем строки
+    # пользователей; и то и другое в порядке user_id, чтобы пакеты не взаимоблокировались
+    await lock_user_writes(conn, user_ids)
+    rows = await conn.fetch('''
+    SELECT user_id, current_balance FROM users
+    WHERE user_id = ANY($1::int[])
+    ORDER BY user_id
+    FOR UPDATE
+    ''', sorted(user_ids))
+    return {row['user_id']: row['current_balance'] for row in rows}
+
+
+async def _reserve_ids(conn, table: str, id_column: str, count: int):
+    # Идентификаторы выделяются заранее, чтобы сопоставить строки COPY с элементами запроса
+    return await conn.fetchval(f'''
+    SELECT array_agg(nextval(pg_get_serial_sequence('{table}', '{id_column}')))
+    FROM generate_series(1, $1)
+    ''', count)
+
+
+async def ingest_expenses(conn, items):
+    """Пакетная загрузка расходов.
+
+    items — список пар (индекс в запросе, ExpenseCreate). Проверка баланса идёт
+    последовательно в порядке запроса, как при поштучной отправке; принятые
+    элементы загружаются через COPY в staging-таблицу, после чего расходы,
+    транзакции и баланс/энергия пользователей обновляются одним запросом.
+    Возвращает (созданные строки в порядке запроса, ошибки по элементам).
+    """
+    errors = []
+    async with conn.transaction():
+        balances = await _lock_users(conn, {item.user_id for _, item in items})
+
+        accepted = []
+        for index, item in items:
+            balance = balances.get(item.user_id)
+            if balance is None:
+                errors.append({"index": index, "detail": USER_NOT_FOUND})
+                continue
+            amount = to_money(item.amount)
+            if balance < amount:
+                errors.append({"index": index, "detail": INSUFFICIENT_FUNDS})
+                continue
+            balances[item.user_id] = balance - amount
+            accepted.append(item)
+
+        if not accepted:
+            return [], errors
+
+        ids = await _reserve_ids(conn, 'expenses', 'expense_id', len(accepted))
+
+        await conn.execute('''
+        CREATE TEMP TABLE expense_staging (
+            expense_id INTEGER,
+            user_id INTEGER,
+            amount NUMERIC(14, 2),
+            category TEXT,
+            description TEXT,
+            date DATE,
+            is_planned BOOLEAN
+        ) ON COMMIT DROP
+        ''')
+        await conn.copy_records_to_table(
+            'expense_staging',
+            records=[
+                (expense_id, item.user_id, to_money(item.amount), item.category,
+                 item.description, item.date, item.is_planned)
+                for expense_id, item in zip(ids, accepted)
+            ],
+        )
+
+        rows = await conn.fetch(f'''
+        WITH inserted AS (
+            INSERT INTO expenses (expense_id, user_id, amount, category, description, date, is_planned)
+            SELECT expense_id, user_id, amount, category, description, date, is_planned
+            FROM expense_staging
+            RETURNING *
+        ), ledger AS (
+            INSERT INTO transactions (user_id, amount, type, category, date, description)
+            SELECT user_id, amount, 'expense', category, date::timestamp, description
+            FROM expense_staging
+            ORDER BY expense_id
+        ), per_user AS (
+            UPDATE users u
+            SET current_balance = u.current_balance - s.total,
+                {energy_update_sql(f"{EXPENSE_ENERGY} * s.cnt")},
+                data_version = u.data_version + 1
+            FROM (
+                SELECT user_id, SUM(amount) AS total, COUNT(*) AS cnt
+                FROM expense_staging
+                GROUP BY user_id
+            ) s
+            WHERE u.user_id = s.user_id
+        )
+        SELECT * FROM inserted ORDER BY expense_id
+        ''')
+
+    return [dict(row) for row in rows], errors
+
+
+async def ingest_incomes(conn, items):
+    """Пакетная загрузка доходов; устроена так же, как ingest_expenses"""
+    errors = []
+    async with conn.transaction():
+        balances = await _lock_users(conn, {item.user_id for _, item in items})
+
+        accepted = []
+        for index, item in items:
+            if item.user_id not in balances:
+                errors.append({"index": index, "detail": USER_NOT_FOUND})
+                continue
+            accepted.append(item)
+
+        if not accepted:
+            return [], errors
+
+        ids = await _reserve_ids(conn, 'incomes', 'income_id', len(accepted))
+
+        await conn.execute('''
+        CREATE TEMP TABLE income_staging (
+            income_id INTEGER,
+            user_id INTEGER,
+            amount NUMERIC(14, 2),
+            source TEXT,
+            date DATE,
+            is_recurring BOOLEAN
+        ) ON COMMIT DROP
+        ''')
+        await conn.copy_records_to_table(
+            'income_staging',
+            records=[
+                (income_id, item.user_id, to_money(item.amount), item.source, item.date, item.is_recurring)
+                for income_id, item in zip(ids, accepted)
+            ],
+        )
+
+        rows = await conn.fetch(f'''
+        WITH inserted AS (
+            INSERT INTO incomes (income_id, user_id, amount, source, date, is_recurring, recurrence_applied)
+            SELECT income_id, user_id, amount, source, date, is_recurring,
+                   GREATEST(0, {months_elapsed_sql('date', 'CURRENT_DATE')})
+            FROM income_staging
+            RETURNING *
+        ), ledger AS (
+            INSERT INTO transactions (user_id, amount, type, category, date, description)
+            SELECT user_id, amount, 'income', source, date::timestamp, 'Доход от ' || source
+            FROM income_staging
+            ORDER BY income_id
+        ), per_user AS (
+            UPDATE users u
+            SET current_balance = u.current_balance + s.total,
+                {energy_update_sql(f"{INCOME_ENERGY} * s.cnt")},
+                food_currency = u.food_currency + 10 * s.cnt,
+                data_version = u.data_version + 1
+            FROM (
+                SELECT user_id, SUM(amount) AS total, COUNT(*) AS cnt
+                FROM income_staging
+                GROUP BY user_id
+            ) s
+            WHERE u.user_id = s.user_id
+        )
+        SELECT * FROM inserted ORDER BY income_id
+        ''')
+
+    return [dict(row) for row in rows], errors
@@ -0,0 +1,185 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+# Конфигурация кэша
+# memory | redis | none; кэш в памяти не видит записей других воркеров,
+# поэтому при нескольких воркерах по умолчанию выключен
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory" if os.getenv("WEB_CONCURRENCY", "1") == "1" else "none")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+# Записи других процессов (отдельный python scheduler.py, другие экземпляры) сбрасывают
+# кэш через уведомления PushHub; при PUSH_ENABLED=0 они видны только по истечении CACHE_TTL
+
+# Пространства ключей, привязанные к пользователю
+USER_NAMESPACES = ("user", "pet", "budgets", "version", "forecast")
+
+
+class MemoryBackend:
+    """LRU-кэш в памяти процесса с TTL на запись"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            self.evictions += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.entries.pop(key, None)
+
+    async def close(self):
+        self.entries.clear()
+
+
+def _decode_value(obj):
+    # JSON не различает даты и строки, поэтому они помечаются явно
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if hasattr(value, "__float__"):
+        return float(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в кэш")
+
+
+class RedisBackend:
+    """Общий кэш для нескольких процессов на Redis-совместимом сервере"""
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("Для CACHE_BACKEND=redis нужен пакет redis")
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.evictions = 0
+
+    async def get(self, key):
+        raw = await self.client.get(key)
+        if raw is None:
+            return None
+        return json.loads(raw, object_hook=_decode_value)
+
+    async def set(self, key, value):
+        await self.client.set(key, json.dumps(value, default=_encode_value), px=int(self.ttl * 1000))
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*keys)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class UserCache:
+    """Read-through кэш пользовательских данных с инвалидацией при записи.
+
+    Поколение пользователя увеличивается при инвалидации во время загрузки;
+    результат загрузки, начатой до инвалидации, в кэш не попадает, чтобы
+    конкурентное чтение не вернуло туда устаревшие данные. Поколения хранятся,
+    только пока у пользователя есть загрузки в процессе.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.generations = {}
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(namespace: str, user_id: int) -> str:
+        return f"cashpet:{namespace}:{user_id}"
+
+    async def get_or_load(self, namespace: str, user_id: int, loader):
+        """Значение из кэша либо результат loader(); None не кэшируется"""
+        if self.backend is None:
+            return await loader()
+
+        key = self._key(namespace, user_id)
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        generation = self.generations.get(user_id, 0)
+        self.loading[user_id] = self.loading.get(user_id, 0) + 1
+        try:
+            value = await loader()
+        finally:
+            fresh = self.generations.get(user_id, 0) == generation
+            self.loading[user_id] -= 1
+            if not self.loading[user_id]:
+                del self.loading[user_id]
+                self.generations.pop(user_id, None)
+        if value is not None and fresh:
+            await self.backend.set(key, value)
+        return value
+
+    async def invalidate_user(self, *user_ids: int):
+        """Сброс всех записей пользователей после изменения их данных"""
+        if self.backend is None:
+            return
+        for user_id in user_ids:
+            if user_id in self.loading:
+                self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        await self.backend.delete(
+            *[self._key(namespace, user_id) for user_id in user_ids for namespace in USER_NAMESPACES]
+        )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions if self.backend else 0,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self.backend.entries) if isinstance(self.backend, MemoryBackend) else None,
+        }
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+
+def create_cache() -> UserCache:
+    """Создание кэша по настройкам окружения"""
+    if CACHE_BACKEND == "redis":
+        return UserCache(RedisBackend(CACHE_URL, CACHE_TTL))
+    if CACHE_BACKEND == "none":
+        return UserCache(None)
+    return UserCache(MemoryBackend(CACHE_MAX_ENTRIES, CACHE_TTL))
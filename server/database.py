@@ -0,0 +1,270 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+
+import asyncpg
+
+from metrics import READ_ROUTING, REPLICA_HEALTHY
+from migrations import ensure_schema
+from timing import InstrumentedConnection, ReadAfter, TimedPool, read_after
+
+# Число процессов uvicorn (uvicorn сам читает эту переменную как значение --workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Размер пула на процесс; 0 — DEFAULT_POOL_MAX_SIZE или доля DB_CONNECTION_BUDGET
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "0"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+DEFAULT_POOL_MAX_SIZE = 10
+# Бюджет соединений, общий для всех экземпляров сервера и их воркеров: число или auto
+# (max_connections сервера за вычетом резерва). Пусто — фиксированный DEFAULT_POOL_MAX_SIZE:
+# к той же базе подключаются планировщик, выгрузки, push и bench.py, их бюджет не учитывает
+DB_CONNECTION_BUDGET = os.getenv("DB_CONNECTION_BUDGET", "")
+# Сколько экземпляров сервера (контейнеров) делят бюджет
+DB_INSTANCES = int(os.getenv("DB_INSTANCES", "1"))
+# Резерв под миграции, планировщик и ручные подключения при DB_CONNECTION_BUDGET=auto
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Соединение пересоздаётся после стольких запросов или столько секунд простоя
+DB_MAX_QUERIES = int(os.getenv("DB_MAX_QUERIES", "50000"))
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+
+# Работа через PgBouncer в режиме transaction: подготовленные операторы живут
+# в серверном соединении, которое между транзакциями может смениться, поэтому их кэш выключен
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+
+def connect_options() -> dict:
+    """Параметры соединения asyncpg, общие для пула и отдельных подключений"""
+    return {"statement_cache_size": 0 if DB_PGBOUNCER else DB_STATEMENT_CACHE_SIZE}
+
+
+async def pool_size(conn):
+    """Размер пула процесса: явно заданный, доля бюджета соединений на воркер или небольшой по умолчанию"""
+    if DB_POOL_MAX_SIZE:
+        max_size = DB_POOL_MAX_SIZE
+    elif DB_CONNECTION_BUDGET:
+        if DB_CONNECTION_BUDGET == "auto":
+            budget = int(await conn.fetchval('SHOW max_connections')) - DB_RESERVED_CONNECTIONS
+        else:
+            budget = int(DB_CONNECTION_BUDGET)
+        max_size = max(2, budget // (WEB_CONCURRENCY * DB_INSTANCES))
+    else:
+        max_size = DEFAULT_POOL_MAX_SIZE
+    min_size = min(DB_POOL_MIN_SIZE or 1, max_size)
+    return min_size, max_size
+
+
+async def _create_pool(dsn: str, min_size: int, max_size: int, hot_queries=()):
+    async def warm_up(conn):
+        await conn.warm_statement_cache(hot_queries)
+
+    return TimedPool(await asyncpg.create_pool(
+        dsn,
+        min_size=min_size,
+        max_size=max_size,
+        max_queries=DB_MAX_QUERIES,
+        max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+        connection_class=InstrumentedConnection,
+        init=warm_up if hot_queries and not DB_PGBOUNCER and DB_STATEMENT_CACHE_SIZE else None,
+        **connect_options()
+    ))
+
+
+async def open_pool(dsn: str, hot_queries=()):
+    """Проверка схемы и создание пула соединений процесса.
+
+    Схема проверяется отдельным соединением до создания пула: прогрев
+    подготавливает запросы к функциям, которые создают миграции.
+    """
+    conn = await asyncpg.connect(dsn, **connect_options())
+    try:
+        await ensure_schema(conn)
+        min_size, max_size = await pool_size(conn)
+    finally:
+        await conn.close()
+
+    pool = await _create_pool(dsn, min_size, max_size, hot_queries)
+    if DATABASE_READ_URLS:
+        pool.on_release = record_write_lsn
+    print(f"🔌 Пул соединений: {min_size}..{max_size}"
+          f"{', PgBouncer' if DB_PGBOUNCER else ''}, воркеров: {WEB_CONCURRENCY}")
+    return pool
+
+
+# Реплики для чтения (через запятую); пусто — все запросы идут в DATABASE_URL
+DATABASE_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+# Сколько секунд после записи пользователя его чтения идут в первичную базу
+READ_PIN_SECONDS = float(os.getenv("READ_PIN_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+# Реплика с бо́льшим отставанием исключается из ротации до следующей проверки
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "2"))
+
+# Отставание реплики в секундах (0, если всё полученное уже применено) и применённый LSN
+REPLICA_LAG_SQL = '''
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END AS lag,
+CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::text AS lsn
+'''
+
+# Read-your-writes между воркерами и экземплярами: ответ на запись несёт LSN первичной
+# базы, клиент возвращает последний полученный в том же заголовке (или cookie), и его
+# чтения идут только в реплики, уже применившие этот LSN, иначе — в первичную базу
+WRITE_LSN_HEADER = "X-Write-LSN"
+WRITE_LSN_COOKIE = "cp_write_lsn"
+# Срок cookie, с: дольше реплика не отстаёт, не будучи исключённой из ротации
+WRITE_LSN_COOKIE_MAX_AGE = 3600
+
+
+def parse_lsn(text):
+    """LSN вида 16/B374D848 в число; None, если строка не LSN"""
+    high, sep, low = (text or "").strip().partition("/")
+    try:
+        return (int(high, 16) << 32) + int(low, 16) if sep else None
+    except ValueError:
+        return None
+
+
+def format_lsn(value: int) -> str:
+    return f"{value >> 32:X}/{value & 0xFFFFFFFF:X}"
+
+
+async def record_write_lsn(conn):
+    """LSN первичной базы с соединения, которое выполнило запись, — до возврата в пул.
+
+    Блок acquire уже завершён, его транзакции зафиксированы, поэтому LSN не меньше
+    LSN их COMMIT. Отдельное соединение для этого не берётся.
+    """
+    token = read_after.get()
+    if token is None or not token.writes:
+        return
+    try:
+        lsn = parse_lsn(await conn.fetchval('SELECT pg_current_wal_lsn()::text'))
+    except (asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        # Запись уже выполнена: без LSN клиент читает после неё по закреплению (pin)
+        print(f"⚠️ LSN записи не получен: {e}")
+        return
+    if lsn:
+        token.wrote(lsn)
+
+
+class ReadRouter:
+    """Выбор пула для чтения: реплики по кругу, первичная база — после записи пользователя.
+
+    Здоровье, отставание и применённый LSN реплик проверяются в фоне; недоступная
+    реплика пропускается, а если подходящих нет, чтения идут в первичную базу.
+    После записи чтения видят её по LSN из запроса клиента (read_after) — на любом
+    воркере и экземпляре. Закрепление пользователя по времени (pin) хранится в памяти
+    процесса и лишь дополняет его для клиентов, которые LSN не возвращают.
+    """
+
+    def __init__(self, primary, urls=(), hot_queries=(), pin_seconds: float = READ_PIN_SECONDS):
+        self.primary = primary
+        self.urls = list(urls)
+        self.hot_queries = hot_queries
+        self.pin_seconds = pin_seconds
+        self.replicas = [None] * len(self.urls)
+        self.healthy = [False] * len(self.urls)
+        self.lag = [None] * len(self.urls)
+        self.replay_lsn = [0] * len(self.urls)
+        self.pinned = {}
+        self.routed = {"replica": 0, "primary": 0, "pinned": 0, "lsn": 0}
+        self.next_replica = 0
+        self.task = None
+
+    def pool(self, user_id: int = None):
+        """Пул для чтения данных пользователя user_id (None — данные не привязаны к пользователю)"""
+        if user_id is not None and self.is_pinned(user_id):
+            return self._route("pinned", self.primary)
+        token = read_after.get()
+        min_lsn = token.min_lsn if token is not None and token.min_lsn else 0
+        for _ in range(len(self.replicas)):
+            index = self.next_replica % len(self.replicas)
+            self.next_replica += 1
+            if self.healthy[index] and self.replay_lsn[index] >= min_lsn:
+                return self._route("replica", self.replicas[index])
+        # lsn — исправные реплики есть, но ни одна ещё не применила запись клиента
+        return self._route("lsn" if min_lsn and any(self.healthy) else "primary", self.primary)
+
+    def _route(self, target: str, pool):
+        READ_ROUTING.inc((target,))
+        self.routed[target] += 1
+        return pool
+
+    def is_pinned(self, user_id: int) -> bool:
+        deadline = self.pinned.get(user_id)
+        if deadline is None:
+            return False
+        if deadline < time.monotonic():
+            del self.pinned[user_id]
+            return False
+        return True
+
+    def pin(self, *user_ids):
+        """Закрепить чтения пользователей за первичной базой (вызывается после записи)"""
+        if not self.replicas:
+            return
+        deadline = time.monotonic() + self.pin_seconds
+        for user_id in user_ids:
+            self.pinned[user_id] = deadline
+
+    async def _open(self, url: str):
+        conn = await asyncpg.connect(url, **connect_options())
+        try:
+            min_size, max_size = await pool_size(conn)
+        finally:
+            await conn.close()
+        return await _create_pool(url, min_size, max_size, self.hot_queries)
+
+    async def check(self):
+        """Проверка реплик: доступность и отставание; недоступные пулы пересоздаются"""
+        for index, url in enumerate(self.urls):
+            try:
+                if self.replicas[index] is None:
+                    self.replicas[index] = await self._open(url)
+                async with self.replicas[index].acquire(timeout=REPLICA_CHECK_INTERVAL) as conn:
+                    row = await conn.fetchrow(REPLICA_LAG_SQL)
+                lag = float(row['lag'])
+                self.replay_lsn[index] = parse_lsn(row['lsn']) or 0
+                self.lag[index] = lag
+                self.healthy[index] = lag <= REPLICA_MAX_LAG
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                if self.healthy[index]:
+                    print(f"⚠️ Реплика {index} недоступна: {e}")
+                self.lag[index] = None
+                self.healthy[index] = False
+            REPLICA_HEALTHY.set((str(index),), int(self.healthy[index]))
+        # Просроченные закрепления удаляются здесь, чтобы словарь не рос
+        now = time.monotonic()
+        self.pinned = {user_id: deadline for user_id, deadline in self.pinned.items() if deadline >= now}
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+            await self.check()
+
+    async def start(self):
+        if self.urls:
+            await self.check()
+            self.task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        for replica in self.replicas:
+            if replica is not None:
+                await replica.close()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [
+                {"index": index, "healthy": self.healthy[index], "lag_seconds": self.lag[index]}
+                for index in range(len(self.urls))
+            ],
+            "pinned_users": len(self.pinned),
+            "routing": dict(self.routed),
+        }
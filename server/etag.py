@@ -0,0 +1,28 @@
+import hashlib
+
+from fastapi import Request, Response
+
+from wire import response_format
+
+
+def make_etag(user_id: int, version: int, request: Request, extra: str = "") -> str:
+    """Слабый ETag: версия данных пользователя + отпечаток пути, параметров запроса и формата ответа"""
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    fingerprint = f"{request.url.path}?{query}|{extra}|{response_format.get()}"
+    digest = hashlib.blake2b(fingerprint.encode(), digest_size=6).hexdigest()
+    return f'W/"{user_id}-{version}-{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Проверка If-None-Match (слабое сравнение, поддерживаются списки и *)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,211 @@
+import asyncio
+import io
+import os
+from datetime import date, timedelta
+
+import asyncpg
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from database import DATABASE_READ_URLS, connect_options
+from timing import InstrumentedConnection
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # pyarrow необязателен: без него доступна только выгрузка в CSV
+    pyarrow = None
+
+# Выгрузки идут через отдельный небольшой пул, чтобы не занимать соединения
+# интерактивных запросов. Пусто — первая реплика, а без реплик — DATABASE_URL
+EXPORT_DATABASE_URL = os.getenv("EXPORT_DATABASE_URL", "")
+# Сколько выгрузок выполняется одновременно (размер пула выгрузок)
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "2"))
+# Сколько порций COPY ждут отправки клиенту; дальше COPY приостанавливается
+EXPORT_QUEUE_CHUNKS = int(os.getenv("EXPORT_QUEUE_CHUNKS", "16"))
+# Строк в группе Parquet (и в одной порции серверного курсора)
+EXPORT_PARQUET_ROWS = int(os.getenv("EXPORT_PARQUET_ROWS", "50000"))
+
+# Таблицы, доступные для выгрузки: столбец даты для фильтра по периоду
+EXPORT_TABLES = {
+    "users": "registration_date",
+    "expenses": "date",
+    "incomes": "date",
+    "transactions": "date",
+    "goals": "deadline",
+    "budgets": "start_date",
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+async def open_export_pool(default_dsn: str):
+    """Пул выгрузок; соединения открываются только при первой выгрузке"""
+    dsn = EXPORT_DATABASE_URL or (DATABASE_READ_URLS[0] if DATABASE_READ_URLS else default_dsn)
+    return await asyncpg.create_pool(
+        dsn,
+        min_size=0,
+        max_size=EXPORT_MAX_CONCURRENCY,
+        connection_class=InstrumentedConnection,
+        **connect_options()
+    )
+
+
+def export_query(table: str, user_id: int = None, start: date = None, end: date = None):
+    """SELECT выгрузки с фильтрами по пользователю и периоду [start, end]"""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="Таблица недоступна для выгрузки")
+    date_column = EXPORT_TABLES[table]
+
+    query = f'SELECT * FROM {table} WHERE TRUE'
+    params = []
+    if user_id is not None:
+        params.append(user_id)
+        query += f' AND user_id = ${len(params)}'
+    if start:
+        params.append(start)
+        query += f' AND {date_column} >= ${len(params)}'
+    if end:
+        # Полуинтервал: для столбцов TIMESTAMP в период входит весь последний день
+        params.append(end + timedelta(days=1))
+        query += f' AND {date_column} < ${len(params)}'
+    return query, params
+
+
+# Типы столбцов PostgreSQL -> типы Parquet. Схема строится по описанию запроса,
+# а не по первой группе строк: столбец, который в ней целиком NULL, иначе получил
+# бы тип null, и следующая группа со значениями не записалась бы
+PARQUET_TYPES = {
+    "bool": lambda: pyarrow.bool_(),
+    "int2": lambda: pyarrow.int16(),
+    "int4": lambda: pyarrow.int32(),
+    "int8": lambda: pyarrow.int64(),
+    "float4": lambda: pyarrow.float32(),
+    "float8": lambda: pyarrow.float64(),
+    # Денежные столбцы — NUMERIC(14, 2)
+    "numeric": lambda: pyarrow.decimal128(14, 2),
+    "text": lambda: pyarrow.string(),
+    "varchar": lambda: pyarrow.string(),
+    "date": lambda: pyarrow.date32(),
+    "timestamp": lambda: pyarrow.timestamp("us"),
+    "timestamptz": lambda: pyarrow.timestamp("us", tz="UTC"),
+}
+
+
+def parquet_schema(attributes):
+    """Схема Parquet по столбцам подготовленного запроса; прочие типы пишутся строками.
+
+    Возвращает (схема, имена столбцов, которые нужно привести к str).
+    """
+    fields, as_text = [], []
+    for attribute in attributes:
+        factory = PARQUET_TYPES.get(attribute.type.name)
+        if factory is None:
+            as_text.append(attribute.name)
+            factory = pyarrow.string
+        fields.append(pyarrow.field(attribute.name, factory()))
+    return pyarrow.schema(fields), as_text
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файл для ParquetWriter: копит записанные байты до отправки клиенту"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def _copy_csv(conn, query: str, params: list, emit):
+    await conn.copy_from_query(query, *params, output=emit, format="csv", header=True)
+
+
+async def _write_parquet(conn, query: str, params: list, emit):
+    # COPY не отдаёт Parquet: строки читаются серверным курсором и пишутся группами
+    sink = _ChunkSink()
+    async with conn.transaction():
+        statement = await conn.prepare(query)
+        schema, as_text = parquet_schema(statement.get_attributes())
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        cursor = await statement.cursor(*params)
+        while True:
+            rows = await cursor.fetch(EXPORT_PARQUET_ROWS)
+            if not rows:
+                break
+            records = [dict(row) for row in rows]
+            for record in records:
+                for name in as_text:
+                    if record[name] is not None:
+                        record[name] = str(record[name])
+            writer.write_table(pyarrow.Table.from_pylist(records, schema=schema))
+            await emit(sink.drain())
+    writer.close()
+    await emit(sink.drain())
+
+
+async def _stream(pool, produce, query: str, params: list):
+    # Очередь ограничена: пока клиент не заберёт данные, производитель ждёт,
+    # а вместе с ним и чтение из PostgreSQL
+    queue = asyncio.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+
+    async def run():
+        try:
+            async with pool.acquire() as conn:
+                await produce(conn, query, params, queue.put)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                print(f"❌ Выгрузка прервана: {chunk}")
+                raise chunk
+            yield chunk
+    finally:
+        # Клиент отключился — COPY прерывается, соединение возвращается в пул
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def stream_export(pool, table: str, fmt: str, user_id: int = None,
+                  start: date = None, end: date = None) -> StreamingResponse:
+    """Потоковая выгрузка таблицы в CSV (COPY ... TO STDOUT) или Parquet.
+
+    Память ограничена EXPORT_QUEUE_CHUNKS порциями COPY (или одной группой Parquet).
+    """
+    if fmt == "parquet" and pyarrow is None:
+        raise HTTPException(status_code=400, detail="Выгрузка в Parquet недоступна: не установлен pyarrow")
+    query, params = export_query(table, user_id, start, end)
+    produce = _write_parquet if fmt == "parquet" else _copy_csv
+
+    name = table if user_id is None else f"{table}_{user_id}"
+    return StreamingResponse(
+        _stream(pool, produce, query, params),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
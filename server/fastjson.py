@@ -0,0 +1,72 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from wire import JSON_MEDIA_TYPE, encode, response_format
+
+# Быстрая выдача списков: строки asyncpg сразу в JSON, без повторной проверки
+# через response_model. Схема OpenAPI по-прежнему берётся из response_model эндпоинта.
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+
+try:
+    import orjson
+except ImportError:
+    # orjson необязателен: без него используется стандартный json
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def render(data) -> tuple:
+    """Тело и media type в формате, согласованном для текущего запроса"""
+    media_type = response_format.get()
+    if media_type == JSON_MEDIA_TYPE:
+        return dumps(data), JSON_MEDIA_TYPE
+    return encode(data, media_type, _default), media_type
+
+
+class NegotiatedResponse(JSONResponse):
+    """Ответ по умолчанию: JSON или двоичный формат из заголовка Accept"""
+
+    def render(self, content) -> bytes:
+        media_type = response_format.get()
+        if media_type == JSON_MEDIA_TYPE:
+            return super().render(content)
+        self.media_type = media_type
+        return encode(content, media_type, _default)
+
+
+def list_response(rows, model, response: Response = None):
+    """Список строк для ответа эндпоинта.
+
+    С FAST_JSON или двоичным форматом — готовое тело прямо из строк asyncpg, только
+    с полями модели (как их отфильтровал бы response_model); иначе — список словарей
+    для обычной проверки FastAPI.
+    response — объект Response эндпоинта, его заголовки (ETag, X-Next-Cursor) переносятся.
+    """
+    if not FAST_JSON and response_format.get() == JSON_MEDIA_TYPE:
+        return [dict(row) for row in rows]
+
+    fields = tuple(model.model_fields)
+    body, media_type = render([{name: row[name] for name in fields} for row in rows])
+    fast = Response(body, media_type=media_type)
+    if response is not None:
+        for name, value in response.headers.items():
+            fast.headers[name] = value
+    return fast
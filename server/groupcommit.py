@@ -0,0 +1,136 @@
+import asyncio
+import os
+
+from metrics import GROUP_COMMIT_BATCH, GROUP_COMMIT_RETRIES
+from timing import ReadAfter, read_after
+
+# Группировка одновременных записей одного пользователя в одну транзакцию
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "1") == "1"
+# Максимум операций в одной транзакции
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "32"))
+
+# Пространство ключей advisory lock пользователя: pg_advisory_xact_lock(пространство, user_id)
+USER_WRITE_LOCK_SPACE = 6768
+
+USER_WRITE_LOCK_SQL = 'SELECT pg_advisory_xact_lock($1, $2)'
+
+# Те же блокировки для многих пользователей сразу: по возрастанию user_id, чтобы
+# записи нескольких пользователей (пакеты, планировщик) не взаимоблокировались
+USERS_WRITE_LOCK_SQL = '''
+SELECT pg_advisory_xact_lock($1, user_id)
+FROM (SELECT DISTINCT unnest($2::int[]) AS user_id ORDER BY user_id) ids
+'''
+
+
+async def lock_user_writes(conn, user_ids):
+    """Блокировки записи пользователей до конца транзакции, как у пакетов UserWriteQueue"""
+    await conn.execute(USERS_WRITE_LOCK_SQL, USER_WRITE_LOCK_SPACE, list(user_ids))
+
+
+class UserWriteQueue:
+    """Очередь записей по пользователям с group commit.
+
+    Все записи пользователя меняют одну строку users. Вместо того чтобы каждая
+    ждала блокировку строки со своим соединением, записи пользователя выполняются
+    по очереди одной задачей: пока идёт текущая, новые копятся и затем выполняются
+    пакетом — одно соединение, одна транзакция, один COMMIT. Каждый вызывающий
+    получает свой результат или свою ошибку.
+
+    Это группировка транзакций, а не слияние изменений: каждая операция
+    выполняет свою функцию БД, и строка users обновляется по разу на операцию.
+    Экономятся COMMIT (сброс WAL) и ожидание блокировки строки между соединениями.
+
+    Между воркерами пакеты одного пользователя упорядочивает advisory lock
+    в начале транзакции: пакет другого воркера ждёт его, не взяв ни одной
+    блокировки строк. Одиночная запись выполняется как без очереди, одним
+    вызовом функции БД: её упорядочивает блокировка строки users, которую
+    все записи берут первой, до строк goals, поэтому цикла ожидания с пакетом нет.
+    """
+
+    def __init__(self, pool, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.pending = {}
+        self.tasks = {}
+
+    async def submit(self, user_id: int, op):
+        """Выполнение op(conn) в очереди пользователя; op может быть выполнена повторно после отката"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(user_id, []).append((op, future, read_after.get()))
+        if user_id not in self.tasks:
+            self.tasks[user_id] = asyncio.create_task(self._drain(user_id))
+        return await future
+
+    async def _drain(self, user_id: int):
+        pending = self.pending[user_id]
+        try:
+            while pending:
+                batch = pending[:self.max_batch]
+                del pending[:self.max_batch]
+                # Отключившимся клиентам запись не нужна: их операции пропускаются
+                batch = [entry for entry in batch if not entry[1].done()]
+                if batch:
+                    await self._apply(user_id, batch)
+        finally:
+            del self.tasks[user_id]
+            del self.pending[user_id]
+            for _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("Очередь записи пользователя остановлена"))
+
+    async def _apply(self, user_id: int, batch):
+        GROUP_COMMIT_BATCH.observe((), len(batch))
+        ops = [op for op, _, _ in batch]
+        # Задача очереди унаследовала контекст первого вызывающего: LSN пакета
+        # собирается в свой ReadAfter и затем передаётся каждому вызывающему
+        tokens = [token for _, _, token in batch if token is not None and token.writes]
+        written = ReadAfter(writes=bool(tokens))
+        read_after.set(written)
+        try:
+            async with self.pool.acquire() as conn:
+                if len(ops) == 1:
+                    # Группировать нечего: один round trip, как без очереди
+                    results = [(True, await ops[0](conn))]
+                else:
+                    results = await self._commit(conn, user_id, ops)
+        except Exception as e:
+            results = [(False, e)] * len(batch)
+
+        if written.write_lsn:
+            for token in tokens:
+                token.wrote(written.write_lsn)
+        for (_, future, _), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    async def _commit(self, conn, user_id: int, ops):
+        # Обычно проходят все операции: пакет выполняется без точек сохранения
+        try:
+            async with conn.transaction():
+                await conn.execute(USER_WRITE_LOCK_SQL, USER_WRITE_LOCK_SPACE, user_id)
+                return [(True, await op(conn)) for op in ops]
+        except Exception:
+            GROUP_COMMIT_RETRIES.inc()
+
+        # Какая-то операция не прошла (например, не хватило средств) и транзакция
+        # откачена: повтор, где каждая операция в своей точке сохранения
+        async with conn.transaction():
+            await conn.execute(USER_WRITE_LOCK_SQL, USER_WRITE_LOCK_SPACE, user_id)
+            results = []
+            for op in ops:
+                try:
+                    async with conn.transaction():
+                        results.append((True, await op(conn)))
+                except Exception as e:
+                    results.append((False, e))
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "users_in_flight": len(self.tasks),
+            "queued": sum(len(pending) for pending in self.pending.values()),
+        }
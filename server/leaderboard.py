@@ -0,0 +1,140 @@
+from fastapi import HTTPException
+
+# Рейтинг пользователей: материализованное представление с готовыми местами
+# по каждому показателю. Место — row_number(), при равенстве выше меньший user_id,
+# поэтому места уникальны и по ним строятся индексы: топ-N и соседи пользователя —
+# это поиск по индексу, а не сортировка всей таблицы users.
+#
+# Первая версия (миграция 9): текущая энергия и refreshed_at в каждой строке,
+# поэтому каждый пересчёт переписывал все строки
+LEADERBOARD_SCHEMA = '''
+CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard AS
+WITH scores AS (
+    SELECT u.user_id, u.name, u.total_saved,
+           COALESCE(g.goals_completed, 0) AS goals_completed,
+           pet_energy_at(u.pet_energy, u.energy_updated_at, LOCALTIMESTAMP) AS pet_energy
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) FILTER (WHERE is_completed) AS goals_completed
+        FROM goals GROUP BY user_id
+    ) g ON g.user_id = u.user_id
+)
+SELECT scores.*,
+       row_number() OVER (ORDER BY total_saved DESC, user_id) AS saved_rank,
+       row_number() OVER (ORDER BY goals_completed DESC, total_saved DESC, user_id) AS goals_rank,
+       row_number() OVER (ORDER BY pet_energy DESC, user_id) AS energy_rank,
+       LOCALTIMESTAMP AS refreshed_at
+FROM scores;
+
+-- Уникальный индекс по user_id нужен для REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_user ON leaderboard(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_saved ON leaderboard(saved_rank);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_goals ON leaderboard(goals_rank);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_energy ON leaderboard(energy_rank);
+'''
+
+# Вторая версия (миграция 10). Строки зависят только от хранимых столбцов, поэтому
+# REFRESH ... CONCURRENTLY не трогает строки, в которых ничего не изменилось. Изменение
+# total_saved или числа целей переписывает строку пользователя и строки всех, чьё место
+# сдвинулось между старой и новой позицией. Энергия у всех убывает одинаково,
+# и порядок по текущей энергии совпадает с порядком по моменту, когда она кончится
+# (energy_empty_at); саму энергию считает запрос чтения.
+# Время пересчёта — в отдельной таблице leaderboard_refresh.
+# Текст применённой миграции не меняется, поэтому он не собирается из констант
+# (360 секунд — 3600 // HUNGER_PER_HOUR): следующая версия — новая миграция.
+LEADERBOARD_REBUILD = '''
+DROP MATERIALIZED VIEW IF EXISTS leaderboard;
+CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard AS
+WITH scores AS (
+    SELECT u.user_id, u.name, u.total_saved,
+           COALESCE(g.goals_completed, 0) AS goals_completed,
+           u.pet_energy AS stored_energy, u.energy_updated_at,
+           u.energy_updated_at + u.pet_energy * interval '360 seconds' AS energy_empty_at
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) FILTER (WHERE is_completed) AS goals_completed
+        FROM goals GROUP BY user_id
+    ) g ON g.user_id = u.user_id
+)
+SELECT scores.*,
+       row_number() OVER (ORDER BY total_saved DESC, user_id) AS saved_rank,
+       row_number() OVER (ORDER BY goals_completed DESC, total_saved DESC, user_id) AS goals_rank,
+       row_number() OVER (ORDER BY energy_empty_at DESC NULLS LAST, user_id) AS energy_rank
+FROM scores;
+
+-- Уникальный индекс по user_id нужен для REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_user ON leaderboard(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_saved ON leaderboard(saved_rank);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_goals ON leaderboard(goals_rank);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_energy ON leaderboard(energy_rank);
+
+CREATE TABLE IF NOT EXISTS leaderboard_refresh (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    refreshed_at TIMESTAMP NOT NULL
+);
+INSERT INTO leaderboard_refresh (refreshed_at) VALUES (LOCALTIMESTAMP)
+ON CONFLICT (id) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at;
+'''
+
+# Строки рейтинга с текущей энергией и временем пересчёта
+LEADERBOARD_SELECT = '''
+SELECT l.*, pet_energy_at(l.stored_energy, l.energy_updated_at, LOCALTIMESTAMP) AS pet_energy, r.refreshed_at
+FROM leaderboard l CROSS JOIN leaderboard_refresh r
+'''
+
+# Показатель рейтинга -> столбец места
+LEADERBOARD_RANKS = {
+    "saved": "saved_rank",
+    "goals": "goals_rank",
+    "energy": "energy_rank",
+}
+
+MAX_LEADERBOARD_SIZE = 100
+
+
+async def refresh_leaderboard(conn, today=None) -> int:
+    """Задача планировщика: пересчёт рейтинга без блокировки чтений; возвращает число мест"""
+    await conn.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY leaderboard')
+    await conn.execute('UPDATE leaderboard_refresh SET refreshed_at = LOCALTIMESTAMP')
+    return await conn.fetchval('SELECT COALESCE(MAX(saved_rank), 0) FROM leaderboard')
+
+
+def _entry(row, rank_column: str) -> dict:
+    return {
+        "rank": row[rank_column],
+        "user_id": row['user_id'],
+        "name": row['name'],
+        "total_saved": row['total_saved'],
+        "goals_completed": row['goals_completed'],
+        "pet_energy": row['pet_energy'],
+    }
+
+
+async def fetch_top(conn, by: str, limit: int) -> dict:
+    """Первые limit мест по показателю by"""
+    rank_column = LEADERBOARD_RANKS[by]
+    rows = await conn.fetch(f'''
+    {LEADERBOARD_SELECT} WHERE l.{rank_column} <= $1 ORDER BY l.{rank_column}
+    ''', limit)
+    return {
+        "by": by,
+        "refreshed_at": rows[0]['refreshed_at'] if rows else None,
+        "entries": [_entry(row, rank_column) for row in rows],
+    }
+
+
+async def fetch_neighbors(conn, user_id: int, by: str, around: int) -> dict:
+    """Место пользователя и по around соседей выше и ниже"""
+    rank_column = LEADERBOARD_RANKS[by]
+    rank = await conn.fetchval(f'SELECT {rank_column} FROM leaderboard WHERE user_id = $1', user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Пользователь ещё не попал в рейтинг")
+    rows = await conn.fetch(f'''
+    {LEADERBOARD_SELECT} WHERE l.{rank_column} BETWEEN $1 AND $2 ORDER BY l.{rank_column}
+    ''', rank - around, rank + around)
+    return {
+        "by": by,
+        "rank": rank,
+        "refreshed_at": rows[0]['refreshed_at'],
+        "entries": [_entry(row, rank_column) for row in rows],
+    }
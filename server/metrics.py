@@ -0,0 +1,179 @@
+import math
+
+# Метрики в текстовом формате Prometheus. Значения хранятся в памяти процесса:
+# при нескольких воркерах uvicorn каждый отдаёт свои, Prometheus собирает их как отдельные цели.
+
+# Границы гистограмм времени, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + list(self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {}
+
+    def inc(self, labels=(), value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, labels=(), value: float = 0):
+        self.values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.values = {}
+
+    def observe(self, labels=(), value: float = 0):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            plain = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{plain} {_format_value(total)}"
+            yield f"{self.name}_count{plain} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "cashpet_http_request_duration_seconds", "Полное время обработки запроса",
+    ("method", "route", "status")
+))
+HTTP_REQUEST_POOL_WAIT = REGISTRY.register(Histogram(
+    "cashpet_http_request_pool_wait_seconds", "Ожидание соединений из пула за запрос",
+    ("method", "route")
+))
+HTTP_REQUEST_DB_TIME = REGISTRY.register(Histogram(
+    "cashpet_http_request_db_seconds", "Время выполнения SQL за запрос",
+    ("method", "route")
+))
+
+POOL_ACQUIRE_WAIT = REGISTRY.register(Histogram(
+    "cashpet_pool_acquire_wait_seconds", "Ожидание одного соединения из пула"
+))
+POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "cashpet_pool_connections", "Соединения пула по состоянию", ("state",)
+))
+POOL_WAITING = REGISTRY.register(Gauge(
+    "cashpet_pool_waiting", "Запросы, ожидающие соединение прямо сейчас"
+))
+POOL_SATURATION = REGISTRY.register(Gauge(
+    "cashpet_pool_saturation", "Доля занятых соединений от максимума пула"
+))
+
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    "cashpet_db_query_duration_seconds", "Время выполнения запроса по отпечатку SQL", ("query_id",)
+))
+DB_QUERY_ROWS = REGISTRY.register(Counter(
+    "cashpet_db_query_rows_total", "Строк возвращено или изменено по отпечатку SQL", ("query_id",)
+))
+DB_QUERY_ERRORS = REGISTRY.register(Counter(
+    "cashpet_db_query_errors_total", "Запросы, завершившиеся ошибкой", ("query_id",)
+))
+DB_QUERY_INFO = REGISTRY.register(Gauge(
+    "cashpet_db_query_info", "Нормализованный текст запроса для query_id", ("query_id", "query")
+))
+
+READ_ROUTING = REGISTRY.register(Counter(
+    "cashpet_read_routing_total", "Чтения по месту выполнения: replica, primary, pinned или lsn (реплики отстают от записи клиента)", ("target",)
+))
+REPLICA_HEALTHY = REGISTRY.register(Gauge(
+    "cashpet_replica_healthy", "Реплика в ротации чтений (1) или исключена (0)", ("replica",)
+))
+
+SINGLEFLIGHT_REQUESTS = REGISTRY.register(Counter(
+    "cashpet_singleflight_requests_total",
+    "Чтения через single-flight: leader выполнил запрос, coalesced дождался чужого", ("endpoint", "role")
+))
+
+GROUP_COMMIT_BATCH = REGISTRY.register(Histogram(
+    "cashpet_group_commit_batch_size", "Операций записи одного пользователя в одной транзакции",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+))
+GROUP_COMMIT_RETRIES = REGISTRY.register(Counter(
+    "cashpet_group_commit_retries_total", "Пакеты, повторённые с точками сохранения из-за ошибки операции"
+))
+
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "cashpet_admission_queue_depth", "Запросы в очереди за соединением по классу приоритета", ("priority",)
+))
+ADMISSION_QUEUE_DELAY = REGISTRY.register(Gauge(
+    "cashpet_admission_queue_delay_seconds", "Сколько ждёт самый старый запрос в очереди за соединением"
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "cashpet_admission_rejected_total",
+    "Запросы, отклонённые с 503: queue — длинная очередь, delay — долгое ожидание, timeout — не дождались соединения",
+    ("priority", "reason")
+))
@@ -0,0 +1,94 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+# Ограничения для постраничной выдачи
+MAX_PAGE_SIZE = 1000
+# Сколько строк серверный курсор забирает за один раз при потоковой выдаче
+STREAM_PREFETCH = 500
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_cursor(row_date, row_id: int) -> str:
+    """Упаковка позиции (date, id) последней строки страницы в токен"""
+    raw = json.dumps([row_date.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Распаковка токена курсора в (date, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        row_date, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        # У date нет разделителя времени, у datetime — есть
+        if "T" in row_date:
+            return datetime.fromisoformat(row_date), int(row_id)
+        return date.fromisoformat(row_date), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
+def apply_keyset(query: str, params: list, id_column: str,
+                 cursor: str = None, limit: int = None, date_column: str = "date") -> str:
+    """Добавляет к запросу условие keyset-пагинации, сортировку и LIMIT.
+
+    Строки отдаются по убыванию (date, id); limit + 1 строка нужна,
+    чтобы понять, есть ли следующая страница.
+    """
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query += f' AND ({date_column}, {id_column}) < (${len(params) + 1}, ${len(params) + 2})'
+        params.extend([cursor_date, cursor_id])
+
+    query += f' ORDER BY {date_column} DESC, {id_column} DESC'
+
+    if limit:
+        query += f' LIMIT ${len(params) + 1}'
+        params.append(limit + 1)
+
+    return query
+
+
+def split_page(rows, limit: int, id_column: str, date_column: str = "date"):
+    """Отрезает лишнюю строку и возвращает (строки страницы, next_cursor)"""
+    if not limit or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[date_column], last[id_column])
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+async def _iter_ndjson(pool, query: str, params: list):
+    # Серверный курсор asyncpg живёт только внутри транзакции
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            chunk = []
+            async for row in conn.cursor(query, *params, prefetch=STREAM_PREFETCH):
+                chunk.append(json.dumps(dict(row), default=_json_default, ensure_ascii=False))
+                if len(chunk) >= STREAM_PREFETCH:
+                    yield "\n".join(chunk) + "\n"
+                    chunk = []
+            if chunk:
+                yield "\n".join(chunk) + "\n"
+
+
+def stream_ndjson(pool, query: str, params: list) -> StreamingResponse:
+    """Потоковая выдача результата запроса в формате NDJSON.
+
+    Строки читаются серверным курсором порциями по STREAM_PREFETCH,
+    поэтому потребление памяти не зависит от размера истории.
+    """
+    return StreamingResponse(_iter_ndjson(pool, query, params), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,310 @@
+import asyncio
+import gzip
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+from rollups import ROLLUP_ROUTINES
+
+# Журнал transactions секционирован по месяцам (RANGE по date).
+# Сколько месяцев вперёд секции создаются заранее
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Сколько месяцев истории хранить в базе; более старые секции выгружаются в архив (0 — хранить всё)
+TRANSACTIONS_RETENTION_MONTHS = int(os.getenv("TRANSACTIONS_RETENTION_MONTHS", "0"))
+# Каталог архива (CSV.gz, по файлу на месяц); при нескольких серверах — общий том
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+
+# Сколько DETACH ждёт блокировку transactions, мс; пока он ждёт, записи встают за ним в очередь
+ARCHIVE_LOCK_TIMEOUT_MS = int(os.getenv("ARCHIVE_LOCK_TIMEOUT_MS", "2000"))
+
+# Обозначение NULL в архиве. Все значения, кроме NULL, пишутся в кавычках (FORCE_QUOTE),
+# поэтому NULL — только \N без кавычек, а текст "\N" остаётся текстом
+ARCHIVE_NULL = "\\N"
+
+# Поле CSV из COPY: в кавычках (удвоенная кавычка внутри) или без них, затем разделитель
+CSV_FIELD = re.compile(r'(?:"([^"]*(?:""[^"]*)*)"|([^,"\r\n]*))(,|\r?\n|\Z)')
+
+# Секция месяца; строки этого месяца, попавшие в секцию по умолчанию, переносятся в неё.
+# Возвращает имя созданной секции или NULL, если секция уже есть.
+PARTITION_ROUTINES = '''
+CREATE OR REPLACE FUNCTION transactions_partition(p_month DATE) RETURNS TEXT AS $$
+DECLARE
+    v_start DATE := date_trunc('month', p_month)::date;
+    v_end DATE := (date_trunc('month', p_month) + interval '1 month')::date;
+    v_name TEXT := 'transactions_' || to_char(v_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM transactions_default WHERE date >= %L AND date < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        v_start, v_end, v_name
+    );
+    -- CHECK совпадает с границами секции: ATTACH не перепроверяет строки
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (date >= %L AND date < %L)',
+                   v_name, v_name || '_range', v_start, v_end);
+    EXECUTE format('ALTER TABLE transactions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   v_name, v_start, v_end);
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', v_name, v_name || '_range');
+    RETURN v_name;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+ARCHIVE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transaction_archives (
+    partition_name TEXT PRIMARY KEY,
+    range_start DATE NOT NULL,
+    range_end DATE NOT NULL,
+    file_name TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT now()
+);
+'''
+
+ENSURE_PARTITIONS_SQL = '''
+SELECT transactions_partition(month::date)
+FROM generate_series(
+    date_trunc('month', $1::date),
+    date_trunc('month', $2::date) + make_interval(months => $3),
+    interval '1 month'
+) AS month
+'''
+
+
+def month_start(day: date, months: int = 0) -> date:
+    """Первое число месяца day, сдвинутого на months месяцев"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def partition_transactions(conn):
+    """Миграция: перенос transactions в секционированную таблицу.
+
+    Старая таблица переименовывается, данные копируются одним INSERT внутри
+    транзакции миграций; триггер агрегатов создаётся уже после копирования,
+    чтобы существующие строки не учлись повторно.
+    """
+    await conn.execute('''
+    ALTER TABLE transactions RENAME TO transactions_unpartitioned;
+    ALTER TABLE transactions_unpartitioned RENAME CONSTRAINT transactions_pkey TO transactions_unpartitioned_pkey;
+    ALTER INDEX idx_transactions_user_date RENAME TO idx_transactions_unpartitioned_user_date;
+    DROP TRIGGER IF EXISTS trg_transactions_rollup ON transactions_unpartitioned;
+
+    -- Ключ секционирования обязан входить в первичный ключ
+    CREATE TABLE transactions (
+        transaction_id INTEGER NOT NULL DEFAULT nextval('transactions_transaction_id_seq'),
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        amount NUMERIC(14, 2) NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        date TIMESTAMP NOT NULL,
+        description TEXT,
+        PRIMARY KEY (transaction_id, date)
+    ) PARTITION BY RANGE (date);
+    CREATE INDEX idx_transactions_user_date ON transactions(user_id, date);
+    -- Даты вне созданных месяцев (далёкое прошлое или будущее)
+    CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+    ALTER SEQUENCE transactions_transaction_id_seq OWNED BY transactions.transaction_id;
+    ''')
+    await conn.execute(ARCHIVE_SCHEMA)
+    await conn.execute(PARTITION_ROUTINES)
+
+    first = await conn.fetchval('SELECT MIN(date)::date FROM transactions_unpartitioned') or date.today()
+    await conn.execute(ENSURE_PARTITIONS_SQL, first, date.today(), PARTITION_MONTHS_AHEAD)
+    await conn.execute('''
+    INSERT INTO transactions (transaction_id, user_id, amount, type, category, date, description)
+    SELECT transaction_id, user_id, amount, type, category, date, description
+    FROM transactions_unpartitioned
+    ''')
+    await conn.execute('DROP TABLE transactions_unpartitioned')
+    await conn.execute(ROLLUP_ROUTINES)
+
+
+async def ensure_partitions(conn, today: date) -> int:
+    """Секции с текущего месяца на PARTITION_MONTHS_AHEAD вперёд; возвращает число созданных"""
+    created = await conn.fetch(ENSURE_PARTITIONS_SQL, today, today, PARTITION_MONTHS_AHEAD)
+    for row in created:
+        if row[0]:
+            print(f"🗂 Создана секция {row[0]}")
+    return sum(1 for row in created if row[0])
+
+
+class PartitionChanged(Exception):
+    """Секция изменилась между COPY и DETACH"""
+
+
+# Отпечаток содержимого секции: совпадает, если после выгрузки строки не добавлялись и не удалялись
+PARTITION_CHECKSUM_SQL = 'SELECT COUNT(*), COALESCE(SUM(transaction_id), 0) FROM {name}'
+
+
+async def _copy_partition(conn, name: str, path: str) -> tuple:
+    """COPY секции в CSV.gz без блокировки transactions; возвращает отпечаток выгруженного.
+
+    Отпечаток и COPY берутся из одного снимка REPEATABLE READ, запись файла — в отдельном потоке.
+    """
+    archive = await asyncio.to_thread(gzip.open, path, "wb")
+    try:
+        async def write(chunk):
+            await asyncio.to_thread(archive.write, chunk)
+
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            checksum = tuple(await conn.fetchrow(PARTITION_CHECKSUM_SQL.format(name=name)))
+            await conn.copy_from_table(name, output=write, format="csv", header=True,
+                                       null=ARCHIVE_NULL, force_quote=True)
+    finally:
+        await asyncio.to_thread(archive.close)
+    return checksum
+
+
+async def archive_partitions(conn, before: date, archive_dir: str = ARCHIVE_DIR) -> int:
+    """Выгрузка в архив секций целиком раньше before; возвращает число выгруженных строк.
+
+    Старая секция сначала копируется в файл без блокировки родительской таблицы,
+    затем короткой транзакцией: DETACH, сверка отпечатка, запись в
+    transaction_archives, DROP. Если в секцию успели записать (расход задним
+    числом), она остаётся в базе до следующего запуска. Агрегаты статистики
+    не меняются, поэтому итоги пользователей по-прежнему включают архивную историю.
+    """
+    await asyncio.to_thread(os.makedirs, archive_dir, exist_ok=True)
+    names = await conn.fetch('''
+    SELECT c.relname
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'transactions'::regclass
+      AND c.relname ~ '^transactions_[0-9]{4}_[0-9]{2}$'
+      AND c.relname < $1
+    ORDER BY c.relname
+    ''', f"transactions_{before:%Y_%m}")
+
+    archived = 0
+    for (name,) in names:
+        year, month = name.rsplit("_", 2)[1:]
+        range_start = date(int(year), int(month), 1)
+        file_name = f"{name}.csv.gz"
+        path = os.path.join(archive_dir, file_name)
+
+        checksum = await _copy_partition(conn, name, path + ".tmp")
+        rows = checksum[0]
+
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = {ARCHIVE_LOCK_TIMEOUT_MS}")
+                await conn.execute(f'ALTER TABLE transactions DETACH PARTITION {name}')
+                if tuple(await conn.fetchrow(PARTITION_CHECKSUM_SQL.format(name=name))) != checksum:
+                    raise PartitionChanged(name)
+                # Файл на месте до коммита: при ошибке секция остаётся в базе, файл перезапишется
+                await asyncio.to_thread(os.replace, path + ".tmp", path)
+                await conn.execute('''
+                INSERT INTO transaction_archives (partition_name, range_start, range_end, file_name, row_count)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (partition_name) DO UPDATE
+                SET file_name = EXCLUDED.file_name, row_count = EXCLUDED.row_count, archived_at = now()
+                ''', name, range_start, month_start(range_start, 1), file_name, rows)
+                await conn.execute(f'DROP TABLE {name}')
+        except PartitionChanged:
+            # Откат вернул секцию на место; выгрузка повторится при следующем запуске
+            print(f"⚠️ Секция {name} изменилась во время выгрузки, повтор при следующем запуске")
+            continue
+
+        archived += rows
+        print(f"📦 Секция {name} выгружена в {path}: {rows} строк")
+    return archived
+
+
+async def maintain_partitions(conn, today: date) -> int:
+    """Задача планировщика: секции наперёд и выгрузка устаревших по TRANSACTIONS_RETENTION_MONTHS"""
+    changed = await ensure_partitions(conn, today)
+    if TRANSACTIONS_RETENTION_MONTHS:
+        changed += await archive_partitions(conn, month_start(today, -TRANSACTIONS_RETENTION_MONTHS))
+    return changed
+
+
+def _csv_fields(line: str) -> list:
+    """Поля одной записи CSV; None — NULL (\\N без кавычек)"""
+    fields = []
+    pos = 0
+    while True:
+        match = CSV_FIELD.match(line, pos)
+        if match is None:
+            raise ValueError(f"Некорректная строка CSV в архиве: {line[:80]!r}")
+        quoted, raw, separator = match.groups()
+        if quoted is not None:
+            fields.append(quoted.replace('""', '"'))
+        else:
+            fields.append(None if raw == ARCHIVE_NULL else raw)
+        pos = match.end()
+        if separator != ",":
+            return fields
+
+
+def _csv_records(lines):
+    """Записи CSV архива по строкам файла.
+
+    Модуль csv не сообщает, было ли поле в кавычках, а только по этому NULL
+    и текст "\\N" различаются, поэтому разбор свой. Запись с переводом строки
+    внутри поля занимает несколько строк файла: она собирается, пока число
+    кавычек нечётное.
+    """
+    pending, quotes = "", 0
+    for line in lines:
+        pending += line
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        yield _csv_fields(pending)
+        pending, quotes = "", 0
+    if pending:
+        raise ValueError("Незакрытые кавычки в конце архива")
+
+
+def _parse_archive_row(row: dict) -> dict:
+    return {
+        "transaction_id": int(row["transaction_id"]),
+        "user_id": int(row["user_id"]),
+        "amount": Decimal(row["amount"]),
+        "type": row["type"],
+        "category": row["category"],
+        "date": datetime.fromisoformat(row["date"]),
+        "description": row["description"],
+    }
+
+
+def _read_archive_file(path: str, user_id: int, start: datetime, end: datetime) -> list:
+    rows = []
+    with gzip.open(path, "rt", newline="") as archive:
+        records = _csv_records(archive)
+        header = next(records, None)
+        for record in records:
+            row = dict(zip(header, record))
+            if int(row["user_id"]) != user_id:
+                continue
+            row = _parse_archive_row(row)
+            if start <= row["date"] <= end:
+                rows.append(row)
+    return rows
+
+
+async def read_archive(conn, user_id: int, start: date = None, end: date = None,
+                       archive_dir: str = ARCHIVE_DIR) -> list:
+    """Транзакции пользователя из архива за [start, end], по убыванию (date, transaction_id).
+
+    Файлы месяцев читаются построчно в отдельном потоке: архив — для редких запросов истории.
+    """
+    start = datetime.combine(start or date.min, datetime.min.time())
+    end = datetime.combine(end or date.max, datetime.max.time())
+    archives = await conn.fetch('''
+    SELECT file_name FROM transaction_archives
+    WHERE range_end > $1::date AND range_start <= $2::date
+    ORDER BY range_start
+    ''', start.date(), end.date())
+
+    rows = []
+    for archive in archives:
+        path = os.path.join(archive_dir, archive['file_name'])
+        rows += await asyncio.to_thread(_read_archive_file, path, user_id, start, end)
+    rows.sort(key=lambda row: (row["date"], row["transaction_id"]), reverse=True)
+    return rows
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+# Параметры питомца
+MAX_ENERGY = 100
+HUNGER_PER_HOUR = 10
+FEED_ENERGY = 20
+INCOME_ENERGY = 10
+EXPENSE_ENERGY = -5
+
+# Энергия хранится как пара (pet_energy, energy_updated_at) и вычисляется
+# на любой момент времени в замкнутой форме. Чтение ничего не пишет;
+# каждая мутация одним UPDATE нормализует состояние на текущий момент
+# и применяет к нему изменение. Голод списывается целыми пунктами, поэтому
+# energy_updated_at сдвигается только на учтённое время: неполный пункт
+# (до 60 / HUNGER_PER_HOUR минут) переносится на следующую мутацию.
+PET_STATE_SCHEMA = '''
+ALTER TABLE users ADD COLUMN IF NOT EXISTS energy_updated_at TIMESTAMP;
+UPDATE users SET energy_updated_at = COALESCE(last_feed_time, LOCALTIMESTAMP) WHERE energy_updated_at IS NULL;
+ALTER TABLE users ALTER COLUMN energy_updated_at SET DEFAULT LOCALTIMESTAMP;
+'''
+
+PET_STATE_ROUTINES = f'''
+CREATE OR REPLACE FUNCTION pet_energy_at(p_energy INTEGER, p_stored_at TIMESTAMP, p_at TIMESTAMP)
+RETURNS INTEGER AS $$
+    SELECT GREATEST(0, LEAST({MAX_ENERGY},
+        p_energy - floor(
+            GREATEST(0, EXTRACT(EPOCH FROM (p_at - COALESCE(p_stored_at, p_at)))) / 3600.0 * {HUNGER_PER_HOUR}
+        )::INTEGER
+    ))
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION pet_energy_anchor(p_stored_at TIMESTAMP, p_at TIMESTAMP)
+RETURNS TIMESTAMP AS $$
+    SELECT CASE
+        WHEN p_stored_at IS NULL OR p_at <= p_stored_at THEN COALESCE(p_stored_at, p_at)
+        ELSE p_stored_at + floor(
+            EXTRACT(EPOCH FROM (p_at - p_stored_at)) / 3600.0 * {HUNGER_PER_HOUR}
+        ) * interval '{3600 // HUNGER_PER_HOUR} seconds'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+'''
+
+
+def energy_update_sql(delta: str) -> str:
+    """Фрагмент SET для атомарного изменения энергии на delta (SQL-выражение)"""
+    return (
+        f"pet_energy = GREATEST(0, LEAST({MAX_ENERGY}, "
+        f"pet_energy_at(pet_energy, energy_updated_at, LOCALTIMESTAMP) + ({delta}))), "
+        f"energy_updated_at = pet_energy_anchor(energy_updated_at, LOCALTIMESTAMP)"
+    )
+
+
+def energy_at(stored_energy: int, stored_at: datetime, now: datetime = None) -> int:
+    """Энергия питомца на момент now по сохранённому состоянию"""
+    now = now or datetime.now()
+    if stored_at is None:
+        return max(0, min(MAX_ENERGY, stored_energy))
+    hours = max(0.0, (now - stored_at).total_seconds() / 3600)
+    return max(0, min(MAX_ENERGY, stored_energy - int(hours * HUNGER_PER_HOUR)))
+
+
+def energy_anchor(stored_at: datetime, now: datetime) -> datetime:
+    """Новое energy_updated_at: момент, до которого голод уже списан (как pet_energy_anchor)"""
+    if stored_at is None or now <= stored_at:
+        return stored_at or now
+    points = int((now - stored_at).total_seconds() / 3600 * HUNGER_PER_HOUR)
+    return stored_at + timedelta(seconds=points * 3600 // HUNGER_PER_HOUR)
+
+
+def pet_status(state: dict, now: datetime = None) -> dict:
+    """Статус питомца для ответа API; state — строка users с полями питомца"""
+    now = now or datetime.now()
+    hours_since_feed = (now - state['last_feed_time']).total_seconds() / 3600
+    return {
+        "food_currency": state['food_currency'],
+        "pet_energy": energy_at(state['pet_energy'], state['energy_updated_at'], now),
+        "hours_without_food": round(hours_since_feed, 1)
+    }
+
+
+async def fetch_pet_energies(conn, user_ids=None, below: int = None):
+    """Пакетный расчёт текущей энергии для многих пользователей одним запросом.
+
+    user_ids=None — по всем пользователям; below — только питомцы с энергией
+    ниже порога (например, для рассылки напоминаний покормить).
+    """
+    query = '''
+    SELECT user_id, food_currency, last_feed_time,
+           pet_energy_at(pet_energy, energy_updated_at, LOCALTIMESTAMP) AS pet_energy
+    FROM users
+    WHERE ($1::int[] IS NULL OR user_id = ANY($1::int[]))
+    '''
+    params = [list(user_ids) if user_ids is not None else None]
+    if below is not None:
+        query += ' AND pet_energy_at(pet_energy, energy_updated_at, LOCALTIMESTAMP) < $2'
+        params.append(below)
+    query += ' ORDER BY user_id'
+    return [dict(row) for row in await conn.fetch(query, *params)]
@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+
+import asyncpg
+from fastapi import HTTPException
+
+from pet_state import EXPENSE_ENERGY, INCOME_ENERGY, energy_update_sql
+from scheduler import months_elapsed_sql
+
+# Собственные SQLSTATE для ошибок бизнес-логики внутри функций БД
+PROCEDURE_ERRORS = {
+    'CP404': 404,
+    'CP400': 400,
+}
+
+# Функции записи: вся цепочка проверок и изменений выполняется на сервере БД
+# одним вызовом, то есть за один сетевой round trip.
+PROCEDURES_ROUTINES = f'''
+CREATE OR REPLACE FUNCTION cp_create_expense(
+    p_user_id INTEGER, p_amount DOUBLE PRECISION, p_category TEXT,
+    p_description TEXT, p_date DATE, p_is_planned BOOLEAN
+) RETURNS SETOF expenses AS $$
+DECLARE
+    v_amount NUMERIC := round(p_amount::numeric, 2);
+    v_balance NUMERIC;
+BEGIN
+    SELECT current_balance INTO v_balance FROM users WHERE user_id = p_user_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Пользователь не найден' USING ERRCODE = 'CP404';
+    END IF;
+    IF v_balance < v_amount THEN
+        RAISE EXCEPTION 'Недостаточно средств' USING ERRCODE = 'CP400';
+    END IF;
+
+    UPDATE users
+    SET current_balance = current_balance - v_amount,
+        {energy_update_sql(EXPENSE_ENERGY)},
+        data_version = data_version + 1
+    WHERE user_id = p_user_id;
+
+    INSERT INTO transactions (user_id, amount, type, category, date, description)
+    VALUES (p_user_id, v_amount, 'expense', p_category, p_date::timestamp, p_description);
+
+    RETURN QUERY
+    WITH inserted AS (
+        INSERT INTO expenses (user_id, amount, category, description, date, is_planned)
+        VALUES (p_user_id, v_amount, p_category, p_description, p_date, p_is_planned)
+        RETURNING *
+    )
+    SELECT * FROM inserted;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION cp_create_income(
+    p_user_id INTEGER, p_amount DOUBLE PRECISION, p_source TEXT,
+    p_date DATE, p_is_recurring BOOLEAN
+) RETURNS SETOF incomes AS $$
+DECLARE
+    v_amount NUMERIC := round(p_amount::numeric, 2);
+BEGIN
+    UPDATE users
+    SET current_balance = current_balance + v_amount,
+        {energy_update_sql(INCOME_ENERGY)},
+        food_currency = food_currency + 10,
+        data_version = data_version + 1
+    WHERE user_id = p_user_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Пользователь не найден' USING ERRCODE = 'CP404';
+    END IF;
+
+    INSERT INTO transactions (user_id, amount, type, category, date, description)
+    VALUES (p_user_id, v_amount, 'income', p_source, p_date::timestamp, 'Доход от ' || p_source);
+
+    RETURN QUERY
+    WITH inserted AS (
+        -- Регулярный доход задним числом: прошедшие повторы не начисляются планировщиком
+        INSERT INTO incomes (user_id, amount, source, date, is_recurring, recurrence_applied)
+        VALUES (p_user_id, v_amount, p_source, p_date, p_is_recurring,
+                GREATEST(0, {months_elapsed_sql('p_date', 'CURRENT_DATE')}))
+        RETURNING *
+    )
+    SELECT * FROM inserted;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION cp_add_money_to_goal(
+    p_goal_id INTEGER, p_user_id INTEGER, p_amount DOUBLE PRECISION, p_bonus INTEGER
+) RETURNS SETOF goals AS $$
+DECLARE
+    v_amount NUMERIC := round(p_amount::numeric, 2);
+    v_balance NUMERIC;
+BEGIN
+    -- Порядок блокировок как у остальных записей: сначала users, потом goals
+    SELECT current_balance INTO v_balance FROM users WHERE user_id = p_user_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Пользователь не найден' USING ERRCODE = 'CP404';
+    END IF;
+
+    PERFORM 1 FROM goals WHERE goal_id = p_goal_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Цель не найдена' USING ERRCODE = 'CP404';
+    END IF;
+
+    IF v_balance < v_amount THEN
+        RAISE EXCEPTION 'Недостаточно средств' USING ERRCODE = 'CP400';
+    END IF;
+
+    UPDATE users
+    SET current_balance = current_balance - v_amount,
+        food_currency = food_currency + p_bonus,
+        data_version = data_version + 1
+    WHERE user_id = p_user_id;
+
+    RETURN QUERY
+    WITH updated AS (
+        UPDATE goals
+        SET current_amount = current_amount + v_amount,
+            is_completed = current_amount + v_amount >= target_amount
+        WHERE goal_id = p_goal_id
+        RETURNING *
+    )
+    SELECT * FROM updated;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+
+@contextmanager
+def procedure_errors():
+    """Перевод ошибок бизнес-логики из функций БД в HTTP-ответы"""
+    try:
+        yield
+    except asyncpg.PostgresError as e:
+        status_code = PROCEDURE_ERRORS.get(e.sqlstate)
+        if status_code is None:
+            raise
+        raise HTTPException(status_code=status_code, detail=e.message)
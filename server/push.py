@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+
+import asyncpg
+
+from pet_state import HUNGER_PER_HOUR, pet_status
+
+# Push-уведомления об изменениях пользователя (баланс, питомец, цели)
+PUSH_ENABLED = os.getenv("PUSH_ENABLED", "1") == "1"
+# LISTEN требует сессионного соединения: за PgBouncer в режиме transaction
+# сюда нужен прямой адрес PostgreSQL
+PUSH_DATABASE_URL = os.getenv("PUSH_DATABASE_URL", "")
+# Период heartbeat для подписчиков, секунды
+PUSH_HEARTBEAT = float(os.getenv("PUSH_HEARTBEAT", "25"))
+
+PUSH_CHANNEL = "cashpet_push"
+
+# Уведомления отправляет сама база после коммита: их получают все воркеры,
+# и никакая запись (эндпоинт, пакет, планировщик) не может их пропустить.
+# Каждая мутация пользователя увеличивает data_version — это и есть условие отправки.
+PUSH_ROUTINES = f'''
+CREATE OR REPLACE FUNCTION user_push_payload(u users) RETURNS json AS $$
+    SELECT json_build_object(
+        'type', 'user',
+        'user_id', u.user_id,
+        'current_balance', u.current_balance,
+        'total_saved', u.total_saved,
+        'food_currency', u.food_currency,
+        'pet_energy', u.pet_energy,
+        'energy_updated_at', u.energy_updated_at,
+        'last_feed_time', u.last_feed_time,
+        'data_version', u.data_version
+    )
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION users_push() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{PUSH_CHANNEL}', user_push_payload(NEW)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_push ON users;
+CREATE TRIGGER trg_users_push
+AFTER UPDATE ON users
+FOR EACH ROW WHEN (OLD.data_version IS DISTINCT FROM NEW.data_version)
+EXECUTE FUNCTION users_push();
+
+CREATE OR REPLACE FUNCTION goals_push() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{PUSH_CHANNEL}', json_build_object(
+        'type', 'goal',
+        'user_id', NEW.user_id,
+        'goal_id', NEW.goal_id,
+        'current_amount', NEW.current_amount,
+        'target_amount', NEW.target_amount,
+        'is_completed', NEW.is_completed,
+        'reward_claimed', NEW.reward_claimed
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_goals_push ON goals;
+CREATE TRIGGER trg_goals_push
+AFTER UPDATE ON goals
+FOR EACH ROW WHEN (
+    (OLD.current_amount, OLD.is_completed, OLD.reward_claimed)
+    IS DISTINCT FROM (NEW.current_amount, NEW.is_completed, NEW.reward_claimed)
+)
+EXECUTE FUNCTION goals_push();
+'''
+
+USER_SNAPSHOT_SQL = 'SELECT user_push_payload(u)::text FROM users u WHERE user_id = $1'
+
+HEARTBEAT = json.dumps({"type": "ping"})
+RESYNC = json.dumps({"type": "resync"})
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def format_message(message: dict) -> str:
+    """Текст уведомления для клиента; для пользователя энергия считается на текущий момент"""
+    message = dict(message)
+    if message["type"] == "user":
+        state = {
+            "food_currency": message.pop("food_currency"),
+            "pet_energy": message.pop("pet_energy"),
+            "energy_updated_at": _timestamp(message.pop("energy_updated_at")),
+            "last_feed_time": datetime.fromisoformat(message.pop("last_feed_time")),
+        }
+        # Между уведомлениями энергия убывает сама; клиент досчитывает её по этой скорости
+        message["pet"] = {**pet_status(state), "hunger_per_hour": HUNGER_PER_HOUR}
+    return json.dumps(message, ensure_ascii=False)
+
+
+class Subscriber:
+    """Подписка одного соединения.
+
+    Хранит только последнее состояние по каждому объекту: медленный клиент
+    пропускает промежуточные значения, а не копит очередь.
+    """
+
+    __slots__ = ("pending", "heartbeat", "event")
+
+    def __init__(self):
+        self.pending = {}
+        self.heartbeat = False
+        self.event = asyncio.Event()
+
+    def push(self, key, message: str):
+        self.pending[key] = message
+        self.event.set()
+
+    def beat(self):
+        self.heartbeat = True
+        self.event.set()
+
+    async def next(self):
+        """Ожидание следующих сообщений; heartbeat приходит как HEARTBEAT"""
+        await self.event.wait()
+        self.event.clear()
+        messages = list(self.pending.values())
+        self.pending.clear()
+        if not messages and self.heartbeat:
+            messages = [HEARTBEAT]
+        self.heartbeat = False
+        return messages
+
+
+class PushHub:
+    """Раздача уведомлений LISTEN/NOTIFY подписчикам процесса.
+
+    Одно соединение LISTEN на воркер; подписчик — объект в словаре без своей
+    задачи, поэтому простаивающие соединения стоят только памяти сокета.
+    Один фоновый цикл рассылает heartbeat и переподключает LISTEN при обрыве.
+    """
+
+    def __init__(self, dsn: str, heartbeat: float = PUSH_HEARTBEAT, on_user_changed=None):
+        self.dsn = dsn
+        self.heartbeat = heartbeat
+        # Корутина user_id -> None на каждое изменение пользователя, в том числе из
+        # других процессов (например, сброс кэша после записей отдельного планировщика)
+        self.on_user_changed = on_user_changed
+        self.subscribers = {}
+        self.conn = None
+        self.task = None
+        self.counters = {"notifications": 0, "delivered": 0, "reconnects": 0}
+
+    async def _connect(self):
+        self.conn = await asyncpg.connect(self.dsn)
+        await self.conn.add_listener(PUSH_CHANNEL, self._on_notify)
+        if self.on_user_changed:
+            await self.conn.add_listener(PUSH_CHANNEL, self._on_user_changed)
+
+    async def _on_user_changed(self, conn, pid, channel, payload):
+        await self.on_user_changed(json.loads(payload)["user_id"])
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.counters["notifications"] += 1
+        message = json.loads(payload)
+        subscribers = self.subscribers.get(message["user_id"])
+        if not subscribers:
+            return
+        key = (message["type"], message.get("goal_id"))
+        text = format_message(message)
+        for subscriber in subscribers:
+            subscriber.push(key, text)
+        self.counters["delivered"] += len(subscribers)
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber()
+        self.subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id: int, subscriber: Subscriber):
+        subscribers = self.subscribers.get(user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[user_id]
+
+    async def snapshot(self, conn, user_id: int):
+        """Текущее состояние пользователя в формате уведомления (None, если пользователя нет)"""
+        payload = await conn.fetchval(USER_SNAPSHOT_SQL, user_id)
+        return format_message(json.loads(payload)) if payload else None
+
+    async def _reconnect(self):
+        try:
+            await self._connect()
+        except (OSError, asyncpg.PostgresError) as e:
+            print(f"❌ LISTEN {PUSH_CHANNEL} недоступен: {e}")
+            return
+        # Пока соединения не было, уведомления терялись: клиенты перечитывают состояние
+        self.counters["reconnects"] += 1
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.push(("resync", None), RESYNC)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if self.conn is None or self.conn.is_closed():
+                await self._reconnect()
+            for subscribers in self.subscribers.values():
+                for subscriber in subscribers:
+                    subscriber.beat()
+
+    async def start(self):
+        await self._connect()
+        self.task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.conn and not self.conn.is_closed():
+            await self.conn.close()
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self.subscribers.values()),
+            "listening": self.conn is not None and not self.conn.is_closed(),
+            **self.counters,
+        }
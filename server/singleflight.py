@@ -0,0 +1,43 @@
+import asyncio
+
+from metrics import SINGLEFLIGHT_REQUESTS
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных чтений.
+
+    Ключ — (эндпоинт, user_id, параметры...). Пока запрос по ключу выполняется,
+    остальные ждут его результат и не берут соединение из пула. Результат не
+    кэшируется: после завершения следующий запрос снова идёт в базу.
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key: tuple, loader):
+        task = self.calls.get(key)
+        if task is not None:
+            SINGLEFLIGHT_REQUESTS.inc((key[0], "coalesced"))
+        else:
+            SINGLEFLIGHT_REQUESTS.inc((key[0], "leader"))
+            # Отдельная задача: отключение первого клиента не отменяет запрос для остальных
+            task = asyncio.ensure_future(loader())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: tuple, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Ошибку получат ожидающие; если их не осталось, asyncio не должен ругаться
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self, *user_ids):
+        """После записи: новые запросы пользователей не присоединяются к начатым до неё.
+
+        Запросы без пользователя (user_id None) тоже могут включать записанные данные.
+        """
+        user_ids = {*user_ids, None}
+        for key in [key for key in self.calls if key[1] in user_ids]:
+            del self.calls[key]
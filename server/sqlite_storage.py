@@ -0,0 +1,652 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time as day_start, timedelta
+
+from fastapi import HTTPException
+
+from metrics import POOL_ACQUIRE_WAIT
+from pagination import apply_keyset, split_page, stream_ndjson
+from pet_state import EXPENSE_ENERGY, FEED_ENERGY, INCOME_ENERGY, MAX_ENERGY, energy_anchor, energy_at
+from rollups import STATS_CATEGORIES_SQL, STATS_TOTALS_SQL
+from storage import Storage, sample_transactions
+from timing import observe_query, request_timing
+
+# Встроенная база для одного узла и тестов (STORAGE_BACKEND=sqlite)
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/cashpet.db")
+# Соединений для чтения; запись всегда идёт через одно соединение
+SQLITE_READERS = int(os.getenv("SQLITE_READERS", "4"))
+# Сколько ждать блокировку записи другого процесса, мс
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Типы Python <-> столбцы SQLite. Даты хранятся текстом ISO 8601,
+# поэтому сравниваются и сортируются как строки (в т.ч. в keyset-пагинации).
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()[:10]))
+sqlite3.register_converter("DATETIME", lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("BOOLEAN", lambda raw: bool(int(raw)))
+
+# Схема совместима с financial_tamagotchi.db: недостающие таблицы создаются,
+# недостающие столбцы users добавляются (SQLITE_USER_COLUMNS).
+# Агрегаты статистики — те же таблицы, что в PostgreSQL, но обновляются
+# построчным триггером: statement-триггеров в SQLite нет.
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    registration_date DATE DEFAULT CURRENT_DATE,
+    total_saved REAL DEFAULT 0,
+    current_balance REAL DEFAULT 0,
+    food_currency INTEGER DEFAULT 100,
+    pet_energy INTEGER DEFAULT 80,
+    last_feed_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+    data_version INTEGER NOT NULL DEFAULT 0,
+    energy_updated_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS goals (
+    goal_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    target_amount REAL NOT NULL,
+    current_amount REAL DEFAULT 0,
+    name TEXT NOT NULL,
+    deadline DATE,
+    is_completed BOOLEAN DEFAULT FALSE,
+    reward_amount INTEGER DEFAULT 50,
+    reward_claimed BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS expenses (
+    expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    amount REAL NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT,
+    date DATE NOT NULL,
+    is_planned BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS incomes (
+    income_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    amount REAL NOT NULL,
+    source TEXT NOT NULL,
+    date DATE NOT NULL,
+    is_recurring BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    amount REAL NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    date DATETIME NOT NULL,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS budgets (
+    budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    period TEXT NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE
+);
+
+CREATE TABLE IF NOT EXISTS user_totals (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    total_income REAL NOT NULL DEFAULT 0,
+    total_expense REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS user_daily_totals (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    income REAL NOT NULL DEFAULT 0,
+    expense REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS user_category_totals (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category)
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_id, date);
+CREATE INDEX IF NOT EXISTS idx_goals_user ON goals(user_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses(user_id, date, expense_id);
+CREATE INDEX IF NOT EXISTS idx_incomes_user_date ON incomes(user_id, date, income_id);
+CREATE INDEX IF NOT EXISTS idx_budgets_user ON budgets(user_id);
+
+-- Агрегаты для базы, где транзакции появились до таблиц агрегатов
+INSERT INTO user_totals (user_id, total_income, total_expense)
+SELECT user_id,
+       COALESCE(SUM(amount) FILTER (WHERE type = 'income'), 0),
+       COALESCE(SUM(amount) FILTER (WHERE type = 'expense'), 0)
+FROM transactions
+WHERE NOT EXISTS (SELECT 1 FROM user_totals)
+GROUP BY user_id;
+
+INSERT INTO user_daily_totals (user_id, day, income, expense)
+SELECT user_id, date(date),
+       COALESCE(SUM(amount) FILTER (WHERE type = 'income'), 0),
+       COALESCE(SUM(amount) FILTER (WHERE type = 'expense'), 0)
+FROM transactions
+WHERE NOT EXISTS (SELECT 1 FROM user_daily_totals)
+GROUP BY user_id, date(date);
+
+INSERT INTO user_category_totals (user_id, category, total)
+SELECT user_id, category, SUM(amount)
+FROM transactions
+WHERE type = 'expense' AND NOT EXISTS (SELECT 1 FROM user_category_totals)
+GROUP BY user_id, category;
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup
+AFTER INSERT ON transactions
+BEGIN
+    INSERT INTO user_totals (user_id, total_income, total_expense)
+    VALUES (NEW.user_id,
+            CASE WHEN NEW.type = 'income' THEN NEW.amount ELSE 0 END,
+            CASE WHEN NEW.type = 'expense' THEN NEW.amount ELSE 0 END)
+    ON CONFLICT (user_id) DO UPDATE
+    SET total_income = total_income + excluded.total_income,
+        total_expense = total_expense + excluded.total_expense;
+
+    INSERT INTO user_daily_totals (user_id, day, income, expense)
+    VALUES (NEW.user_id, date(NEW.date),
+            CASE WHEN NEW.type = 'income' THEN NEW.amount ELSE 0 END,
+            CASE WHEN NEW.type = 'expense' THEN NEW.amount ELSE 0 END)
+    ON CONFLICT (user_id, day) DO UPDATE
+    SET income = income + excluded.income,
+        expense = expense + excluded.expense;
+
+    INSERT INTO user_category_totals (user_id, category, total)
+    SELECT NEW.user_id, NEW.category, NEW.amount
+    WHERE NEW.type = 'expense'
+    ON CONFLICT (user_id, category) DO UPDATE
+    SET total = total + excluded.total;
+END;
+'''
+
+# Столбцы, которых нет в исходной financial_tamagotchi.db
+SQLITE_USER_COLUMNS = {
+    "data_version": "data_version INTEGER NOT NULL DEFAULT 0",
+    "energy_updated_at": "energy_updated_at TIMESTAMP",
+}
+
+SQLITE_STATS_DAILY_SQL = '''
+SELECT day, income, expense
+FROM user_daily_totals
+WHERE user_id = $1 AND day >= $2
+ORDER BY day DESC
+'''
+
+# Состояние пользователя, которое меняют операции записи
+USER_STATE_SQL = '''
+SELECT current_balance, food_currency, pet_energy, energy_updated_at
+FROM users WHERE user_id = $1
+'''
+
+
+def _params(args) -> dict:
+    # $1..$n в запросах — именованные параметры SQLite с именами "1".."n"
+    return {str(index): value for index, value in enumerate(args, 1)}
+
+
+def _status(query: str, rowcount: int) -> str:
+    # Статус команды в формате asyncpg: "UPDATE 1", "INSERT 0 1"
+    command = query.split(None, 1)[0].upper() if query.strip() else ""
+    if command == "INSERT":
+        return f"INSERT 0 {max(rowcount, 0)}"
+    return f"{command} {max(rowcount, 0)}"
+
+
+def _shifted_energy(state, delta: int, now: datetime) -> int:
+    """Энергия после изменения на delta с учётом голода на момент now (как energy_update_sql)"""
+    return max(0, min(MAX_ENERGY, energy_at(state['pet_energy'], state['energy_updated_at'], now) + delta))
+
+
+def _observe_wait(started: float):
+    waited = time.perf_counter() - started
+    POOL_ACQUIRE_WAIT.observe((), waited)
+    timing = request_timing.get()
+    if timing is not None:
+        timing.pool_wait += waited
+
+
+class SqliteConnection:
+    """Соединение SQLite с интерфейсом соединения asyncpg: fetch, fetchrow, fetchval,
+    execute, transaction и cursor. Все вызовы выполняются в собственном потоке соединения.
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-read" if readonly else "sqlite-write")
+        self._conn = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES,
+                               isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+        conn.execute('PRAGMA foreign_keys = ON')
+        # В режиме WAL synchronous=NORMAL не теряет согласованность, только последние
+        # транзакции при сбое питания
+        conn.execute('PRAGMA synchronous = NORMAL')
+        if self.readonly:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    async def run(self, fn, *args):
+        """Вызов fn(sqlite3.Connection, *args) в потоке соединения"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, self._conn, *args)
+
+    async def open(self):
+        self._conn = await asyncio.get_running_loop().run_in_executor(self._executor, self._connect)
+        return self
+
+    async def close(self):
+        if self._conn is not None:
+            await self.run(lambda conn: conn.close())
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    async def _timed(self, fn, query: str, args, count_rows):
+        started = time.perf_counter()
+        try:
+            result = await self.run(fn, query, _params(args))
+        except Exception:
+            observe_query(query, time.perf_counter() - started, 0, failed=True)
+            raise
+        observe_query(query, time.perf_counter() - started, count_rows(result))
+        return result
+
+    async def fetch(self, query: str, *args):
+        return await self._timed(lambda conn, q, p: conn.execute(q, p).fetchall(), query, args, len)
+
+    async def fetchrow(self, query: str, *args):
+        # Выборка до конца: оператор с RETURNING завершается, и транзакцию можно зафиксировать
+        rows = await self.fetch(query, *args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, query: str, *args):
+        row = await self.fetchrow(query, *args)
+        return row[0] if row else None
+
+    async def execute(self, query: str, *args):
+        return await self._timed(
+            lambda conn, q, p: _status(q, conn.execute(q, p).rowcount), query, args, lambda status: int(status.rsplit(" ", 1)[-1])
+        )
+
+    @asynccontextmanager
+    async def transaction(self):
+        # BEGIN IMMEDIATE берёт блокировку записи сразу, а не при первом изменении:
+        # проверка и изменение внутри транзакции не пересекаются с другим процессом
+        await self.execute('BEGIN' if self.readonly else 'BEGIN IMMEDIATE')
+        try:
+            yield self
+        except BaseException:
+            await self.execute('ROLLBACK')
+            raise
+        await self.execute('COMMIT')
+
+    def cursor(self, query: str, *args, prefetch: int = 100):
+        """Построчное чтение результата порциями по prefetch строк (как курсор asyncpg)"""
+        return self._iterate(query, _params(args), prefetch)
+
+    async def _iterate(self, query: str, params: dict, prefetch: int):
+        cursor = await self.run(lambda conn: conn.execute(query, params))
+        try:
+            while True:
+                rows = await self.run(lambda conn: cursor.fetchmany(prefetch))
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            await self.run(lambda conn: cursor.close())
+
+
+class SqliteWriter:
+    """Единственное соединение для записи.
+
+    SQLite допускает одного писателя, поэтому запись в процессе сериализуется
+    очередью asyncio.Lock, а не повторными попытками по busy_timeout.
+    """
+
+    def __init__(self, conn: SqliteConnection):
+        self.conn = conn
+        self.lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        async with self.lock:
+            _observe_wait(started)
+            yield self.conn
+
+
+class SqliteReaders:
+    """Пул соединений для чтения: в режиме WAL чтения не ждут писателя и друг друга"""
+
+    def __init__(self, conns):
+        self.conns = conns
+        self.idle = asyncio.Queue()
+        for conn in conns:
+            self.idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        conn = await self.idle.get()
+        _observe_wait(started)
+        try:
+            yield conn
+        finally:
+            self.idle.put_nowait(conn)
+
+
+def ensure_sqlite_schema(conn: sqlite3.Connection):
+    """Создание и дополнение схемы; conn — sqlite3 с row_factory=sqlite3.Row"""
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.executescript(f'BEGIN IMMEDIATE; {SQLITE_SCHEMA} COMMIT;')
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(users)')}
+        for name, column in SQLITE_USER_COLUMNS.items():
+            if name not in columns:
+                conn.execute(f'ALTER TABLE users ADD COLUMN {column}')
+        conn.execute('''
+        UPDATE users SET energy_updated_at = COALESCE(last_feed_time, $1) WHERE energy_updated_at IS NULL
+        ''', {"1": datetime.now()})
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+class SqliteStorage(Storage):
+    """Встроенная SQLite: одно соединение записи и пул соединений чтения в режиме WAL.
+
+    Логика функций БД из procedures.py выполняется здесь же, в транзакции писателя.
+    Деньги хранятся в REAL (как в исходной financial_tamagotchi.db) и округляются при записи.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, writer: SqliteWriter, readers: SqliteReaders):
+        super().__init__(writer, lambda user_id=None: readers)
+        self.writer = writer
+        self.readers = readers
+
+    @classmethod
+    async def open(cls, path: str = SQLITE_PATH, readers: int = SQLITE_READERS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        writer = await SqliteConnection(path).open()
+        await writer.run(ensure_sqlite_schema)
+        reader_conns = [await SqliteConnection(path, readonly=True).open() for _ in range(max(1, readers))]
+
+        print(f"✅ SQLite база данных инициализирована: {path} (соединений чтения: {len(reader_conns)})")
+        return cls(SqliteWriter(writer), SqliteReaders(reader_conns))
+
+    def fresh_pool(self):
+        # Зафиксированная запись сразу видна новым чтениям WAL: отставания, как у реплик, нет
+        return self.readers
+
+    async def close(self):
+        for conn in (self.writer.conn, *self.readers.conns):
+            await conn.close()
+
+    # ---------- Пользователи ----------
+    async def create_user(self, user):
+        now = datetime.now()
+        async with self.writer.acquire() as conn:
+            try:
+                row = await conn.fetchrow('''
+                INSERT INTO users (name, email, registration_date, total_saved, current_balance, food_currency, pet_energy,
+                                   last_feed_time, energy_updated_at)
+                VALUES ($1, $2, $3, round($4, 2), round($5, 2), $6, $7, $8, $8)
+                RETURNING *
+                ''', user.name, user.email, user.registration_date or now.date(),
+                   user.total_saved, user.current_balance, user.food_currency, user.pet_energy, now)
+            except sqlite3.IntegrityError as e:
+                if "UNIQUE" in str(e):
+                    raise HTTPException(status_code=400, detail="Email уже существует")
+                raise HTTPException(status_code=400, detail=str(e))
+        return dict(row)
+
+    async def update_user(self, user_id: int, user):
+        async with self.writer.acquire() as conn:
+            row = await conn.fetchrow('''
+            UPDATE users
+            SET name = $1, email = $2, registration_date = $3, total_saved = round($4, 2),
+                current_balance = round($5, 2), food_currency = $6, pet_energy = $7,
+                energy_updated_at = $8,
+                data_version = data_version + 1
+            WHERE user_id = $9
+            RETURNING *
+            ''', user.name, user.email, user.registration_date,
+               user.total_saved, user.current_balance, user.food_currency,
+               user.pet_energy, datetime.now(), user_id)
+        return dict(row) if row else None
+
+    # ---------- Расходы и доходы ----------
+    async def create_expense(self, expense):
+        amount = round(expense.amount, 2)
+        now = datetime.now()
+        async with self.writer.acquire() as conn:
+            async with conn.transaction():
+                state = await conn.fetchrow(USER_STATE_SQL, expense.user_id)
+                if not state:
+                    raise HTTPException(status_code=404, detail="Пользователь не найден")
+                if state['current_balance'] < amount:
+                    raise HTTPException(status_code=400, detail="Недостаточно средств")
+
+                await conn.execute('''
+                UPDATE users
+                SET current_balance = round(current_balance - $1, 2),
+                    pet_energy = $2, energy_updated_at = $3,
+                    data_version = data_version + 1
+                WHERE user_id = $4
+                ''', amount, _shifted_energy(state, EXPENSE_ENERGY, now),
+                   energy_anchor(state['energy_updated_at'], now), expense.user_id)
+
+                await conn.execute('''
+                INSERT INTO transactions (user_id, amount, type, category, date, description)
+                VALUES ($1, $2, 'expense', $3, $4, $5)
+                ''', expense.user_id, amount, expense.category,
+                   datetime.combine(expense.date, day_start()), expense.description)
+
+                row = await conn.fetchrow('''
+                INSERT INTO expenses (user_id, amount, category, description, date, is_planned)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                RETURNING *
+                ''', expense.user_id, amount, expense.category, expense.description, expense.date, expense.is_planned)
+        return dict(row)
+
+    async def create_income(self, income):
+        amount = round(income.amount, 2)
+        now = datetime.now()
+        async with self.writer.acquire() as conn:
+            async with conn.transaction():
+                state = await conn.fetchrow(USER_STATE_SQL, income.user_id)
+                if not state:
+                    raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+                await conn.execute('''
+                UPDATE users
+                SET current_balance = round(current_balance + $1, 2),
+                    pet_energy = $2, energy_updated_at = $3,
+                    food_currency = food_currency + 10,
+                    data_version = data_version + 1
+                WHERE user_id = $4
+                ''', amount, _shifted_energy(state, INCOME_ENERGY, now),
+                   energy_anchor(state['energy_updated_at'], now), income.user_id)
+
+                await conn.execute('''
+                INSERT INTO transactions (user_id, amount, type, category, date, description)
+                VALUES ($1, $2, 'income', $3, $4, 'Доход от ' || $3)
+                ''', income.user_id, amount, income.source, datetime.combine(income.date, day_start()))
+
+                row = await conn.fetchrow('''
+                INSERT INTO incomes (user_id, amount, source, date, is_recurring)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING *
+                ''', income.user_id, amount, income.source, income.date, income.is_recurring)
+        return dict(row)
+
+    # ---------- Цели ----------
+    async def create_goal(self, goal):
+        async with self.writer.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow('''
+                INSERT INTO goals (user_id, target_amount, current_amount, name, deadline, is_completed, reward_amount, reward_claimed)
+                VALUES ($1, round($2, 2), round($3, 2), $4, $5, $6, $7, $8)
+                RETURNING *
+                ''', goal.user_id, goal.target_amount, goal.current_amount,
+                   goal.name, goal.deadline, goal.is_completed, goal.reward_amount, goal.reward_claimed)
+                await conn.execute('UPDATE users SET data_version = data_version + 1 WHERE user_id = $1', goal.user_id)
+        return dict(row)
+
+    async def add_money_to_goal(self, goal_id: int, user_id: int, amount: float, bonus: int):
+        amount = round(amount, 2)
+        async with self.writer.acquire() as conn:
+            async with conn.transaction():
+                if not await conn.fetchval('SELECT 1 FROM goals WHERE goal_id = $1', goal_id):
+                    raise HTTPException(status_code=404, detail="Цель не найдена")
+
+                state = await conn.fetchrow(USER_STATE_SQL, user_id)
+                if not state:
+                    raise HTTPException(status_code=404, detail="Пользователь не найден")
+                if state['current_balance'] < amount:
+                    raise HTTPException(status_code=400, detail="Недостаточно средств")
+
+                await conn.execute('''
+                UPDATE users
+                SET current_balance = round(current_balance - $1, 2),
+                    food_currency = food_currency + $2,
+                    data_version = data_version + 1
+                WHERE user_id = $3
+                ''', amount, bonus, user_id)
+
+                await conn.execute('''
+                UPDATE goals
+                SET current_amount = round(current_amount + $1, 2),
+                    is_completed = current_amount + $1 >= target_amount
+                WHERE goal_id = $2
+                ''', amount, goal_id)
+                # Не RETURNING: он отдаёт целые значения REAL-столбцов как int
+                row = await conn.fetchrow('SELECT * FROM goals WHERE goal_id = $1', goal_id)
+        return dict(row)
+
+    # ---------- Транзакции ----------
+    async def list_transactions(self, user_id: int, days: int = None,
+                                cursor: str = None, limit: int = None, stream: bool = False):
+        query = 'SELECT * FROM transactions WHERE user_id = $1'
+        params = [user_id]
+        if days:
+            query += ' AND date >= $2'
+            params.append(datetime.now() - timedelta(days=days))
+
+        query = apply_keyset(query, params, 'transaction_id', cursor, limit)
+        if stream:
+            return stream_ndjson(self.readers, query, params), None
+
+        async with self.readers.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+        return split_page(rows, limit, 'transaction_id')
+
+    async def transaction_stats(self, user_id: int):
+        async with self.readers.acquire() as conn:
+            totals = await conn.fetchrow(STATS_TOTALS_SQL, user_id)
+            daily = await conn.fetch(SQLITE_STATS_DAILY_SQL, user_id, date.today() - timedelta(days=7))
+            categories = await conn.fetch(STATS_CATEGORIES_SQL, user_id)
+
+        return {
+            "totals": dict(totals),
+            "daily": [dict(row) for row in daily],
+            "categories": [dict(row) for row in categories]
+        }
+
+    # ---------- Питомец ----------
+    async def feed_pet(self, user_id: int, food_amount: int, bonus: int):
+        now = datetime.now()
+        async with self.writer.acquire() as conn:
+            async with conn.transaction():
+                state = await conn.fetchrow(USER_STATE_SQL, user_id)
+                if not state:
+                    raise HTTPException(status_code=404, detail="Пользователь не найден")
+                if state['food_currency'] < food_amount:
+                    raise HTTPException(status_code=400, detail="Недостаточно корма")
+
+                row = await conn.fetchrow('''
+                UPDATE users
+                SET food_currency = food_currency - $1 + $2,
+                    pet_energy = $3, energy_updated_at = $4,
+                    last_feed_time = $5,
+                    data_version = data_version + 1
+                WHERE user_id = $6
+                RETURNING food_currency, pet_energy
+                ''', food_amount, bonus, _shifted_energy(state, FEED_ENERGY, now),
+                   energy_anchor(state['energy_updated_at'], now), now, user_id)
+        return dict(row)
+
+    # ---------- Бюджет ----------
+    async def create_budget(self, budget):
+        async with self.writer.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow('''
+                INSERT INTO budgets (user_id, category, amount, period, start_date, end_date)
+                VALUES ($1, $2, round($3, 2), $4, $5, $6)
+                RETURNING *
+                ''', budget.user_id, budget.category, budget.amount,
+                   budget.period, budget.start_date, budget.end_date)
+                await conn.execute('UPDATE users SET data_version = data_version + 1 WHERE user_id = $1', budget.user_id)
+        return dict(row)
+
+    # ---------- Тестовые данные ----------
+    async def create_sample_user(self):
+        async with self.writer.acquire() as conn:
+            async with conn.transaction():
+                count = await conn.fetchval('SELECT COUNT(*) FROM users')
+                if count > 0:
+                    return None
+
+                now = datetime.now()
+                user_id = await conn.fetchval('''
+                INSERT INTO users (name, email, total_saved, current_balance, food_currency, pet_energy,
+                                   registration_date, last_feed_time, energy_updated_at)
+                VALUES ('Иван Иванов', 'ivan@example.com', 50000, 150000, 100, 80, $1, $2, $2)
+                RETURNING user_id
+                ''', now.date(), now)
+
+                await conn.execute('''
+                INSERT INTO goals (user_id, target_amount, current_amount, name, deadline, reward_amount)
+                VALUES
+                ($1, 50000, 25000, 'Новый ноутбук', date($2, '+3 months'), 60),
+                ($1, 100000, 30000, 'Отпуск на море', date($2, '+6 months'), 80),
+                ($1, 1000000, 150000, 'Машина мечты', date($2, '+1 year'), 100)
+                ''', user_id, now.date())
+
+                for row in sample_transactions(user_id, now):
+                    await conn.execute('''
+                    INSERT INTO transactions (user_id, amount, type, category, date)
+                    VALUES ($1, $2, $3, $4, $5)
+                    ''', *row)
+        return user_id
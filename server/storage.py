@@ -0,0 +1,378 @@
+import os
+import random
+from datetime import date, datetime, timedelta
+
+import asyncpg
+from fastapi import HTTPException
+
+from groupcommit import GROUP_COMMIT, UserWriteQueue
+from pagination import apply_keyset, split_page, stream_ndjson
+from pet_state import FEED_ENERGY, energy_update_sql
+from procedures import procedure_errors
+from rollups import STATS_QUERIES, fetch_stats
+
+# Хранилище данных эндпоинтов: postgres | sqlite. SQLite — для одного узла
+# и тестов; фоновые задачи, реплики, push-уведомления и выгрузки есть только у PostgreSQL.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+
+# Горячие запросы: подготавливаются на каждом соединении пула при старте
+USER_VERSION_SQL = 'SELECT data_version FROM users WHERE user_id = $1'
+
+USER_SQL = 'SELECT * FROM users WHERE user_id = $1'
+
+PET_STATE_SQL = '''
+SELECT food_currency, pet_energy, energy_updated_at, last_feed_time
+FROM users WHERE user_id = $1
+'''
+
+CREATE_EXPENSE_SQL = 'SELECT * FROM cp_create_expense($1, $2, $3, $4, $5, $6)'
+
+CREATE_INCOME_SQL = 'SELECT * FROM cp_create_income($1, $2, $3, $4, $5)'
+
+FEED_PET_SQL = f'''
+UPDATE users
+SET food_currency = food_currency - $1 + $2,
+    {energy_update_sql(FEED_ENERGY)},
+    last_feed_time = LOCALTIMESTAMP,
+    data_version = data_version + 1
+WHERE user_id = $3 AND food_currency >= $1
+RETURNING food_currency, pet_energy
+'''
+
+HOT_QUERIES = (
+    USER_VERSION_SQL, USER_SQL, PET_STATE_SQL, CREATE_EXPENSE_SQL, CREATE_INCOME_SQL, FEED_PET_SQL,
+    *STATS_QUERIES,
+)
+
+HOT_READ_QUERIES = (PET_STATE_SQL, *STATS_QUERIES)
+
+SAMPLE_CATEGORIES = ['Продукты', 'Транспорт', 'Жильё', 'Одежда', 'Здоровье', 'Развлечения']
+SAMPLE_SOURCES = ['Зарплата', 'Фриланс', 'Подарок', 'Инвестиции', 'Премия']
+
+
+def sample_transactions(user_id: int, now: datetime):
+    """Доход и расход за каждый из последних 30 дней: (user_id, amount, type, category, date)"""
+    for i in range(30):
+        trans_date = now - timedelta(days=i)
+        yield user_id, random.randint(1000, 5000), 'income', random.choice(SAMPLE_SOURCES), trans_date
+        yield user_id, random.randint(500, 3000), 'expense', random.choice(SAMPLE_CATEGORIES), trans_date
+
+
+def _dated_query(table: str, id_column: str, user_id: int = None,
+                 start_date: date = None, end_date: date = None,
+                 cursor: str = None, limit: int = None):
+    """Запрос списка расходов/доходов с фильтрами и keyset-пагинацией"""
+    query = f'SELECT * FROM {table} WHERE 1=1'
+    params = []
+    param_index = 1
+
+    if user_id:
+        query += f' AND user_id = ${param_index}'
+        params.append(user_id)
+        param_index += 1
+    if start_date:
+        query += f' AND date >= ${param_index}'
+        params.append(start_date)
+        param_index += 1
+    if end_date:
+        query += f' AND date <= ${param_index}'
+        params.append(end_date)
+        param_index += 1
+
+    return apply_keyset(query, params, id_column, cursor, limit), params
+
+
+class Storage:
+    """Запросы эндпоинтов, общие для PostgreSQL и SQLite.
+
+    pool — соединения для записи; fresh_pool() — для чтений, которые должны видеть
+    последнюю запись (версия и данные под ETag); read_pool(user_id) — для остальных чтений.
+    Списочные методы возвращают строки и следующий курсор, а при stream=True — потоковый ответ.
+    """
+
+    backend = None
+
+    def __init__(self, pool, read_pool=None):
+        self.pool = pool
+        self.read_pool = read_pool or (lambda user_id=None: pool)
+        # Очередь записей по пользователям (group commit); None — каждая запись со своим соединением
+        self.writes = None
+
+    def fresh_pool(self):
+        # Реплики отстают, поэтому такие чтения идут в первичную базу
+        return self.pool
+
+    async def _write(self, user_id: int, op):
+        """Запись, меняющая строку пользователя: op(conn) через очередь пользователя, если она есть"""
+        if self.writes is not None:
+            return await self.writes.submit(user_id, op)
+        async with self.pool.acquire() as conn:
+            return await op(conn)
+
+    # ---------- Пользователи ----------
+    async def user_version(self, user_id: int):
+        async with self.fresh_pool().acquire() as conn:
+            return await conn.fetchval(USER_VERSION_SQL, user_id)
+
+    async def get_user(self, user_id: int):
+        async with self.fresh_pool().acquire() as conn:
+            row = await conn.fetchrow(USER_SQL, user_id)
+            return dict(row) if row else None
+
+    async def list_users(self):
+        async with self.read_pool().acquire() as conn:
+            return await conn.fetch('SELECT * FROM users ORDER BY user_id')
+
+    async def delete_user(self, user_id: int) -> bool:
+        async with self.pool.acquire() as conn:
+            result = await conn.execute('DELETE FROM users WHERE user_id = $1', user_id)
+        return result != "DELETE 0"
+
+    # ---------- Расходы и доходы ----------
+    async def _list_dated(self, table: str, id_column: str, user_id, start_date, end_date, cursor, limit, stream):
+        query, params = _dated_query(table, id_column, user_id, start_date, end_date, cursor, limit)
+        pool = self.read_pool(user_id)
+        if stream:
+            return stream_ndjson(pool, query, params), None
+
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+        return split_page(rows, limit, id_column)
+
+    async def list_expenses(self, user_id: int = None, start_date: date = None, end_date: date = None,
+                            cursor: str = None, limit: int = None, stream: bool = False):
+        return await self._list_dated('expenses', 'expense_id', user_id, start_date, end_date, cursor, limit, stream)
+
+    async def list_incomes(self, user_id: int = None, start_date: date = None, end_date: date = None,
+                           cursor: str = None, limit: int = None, stream: bool = False):
+        return await self._list_dated('incomes', 'income_id', user_id, start_date, end_date, cursor, limit, stream)
+
+    # ---------- Цели ----------
+    async def list_goals(self, user_id: int = None, completed: bool = None):
+        query = 'SELECT * FROM goals WHERE 1=1'
+        params = []
+        param_index = 1
+
+        if user_id:
+            query += f' AND user_id = ${param_index}'
+            params.append(user_id)
+            param_index += 1
+        if completed is not None:
+            query += f' AND is_completed = ${param_index}'
+            params.append(completed)
+            param_index += 1
+
+        query += ' ORDER BY deadline ASC'
+        async with self.fresh_pool().acquire() as conn:
+            return await conn.fetch(query, *params)
+
+    async def claim_goal_reward(self, goal_id: int, user_id: int) -> int:
+        """Начисление награды за выполненную цель; возвращает размер награды"""
+        async def claim(conn):
+            async with conn.transaction():
+                # Строка users блокируется первой, как во всех записях пользователя:
+                # повторный запрос награды ждёт первый и видит reward_claimed
+                await conn.execute('UPDATE users SET data_version = data_version + 1 WHERE user_id = $1', user_id)
+                goal = await conn.fetchrow('SELECT * FROM goals WHERE goal_id = $1 AND user_id = $2', goal_id, user_id)
+                if not goal:
+                    raise HTTPException(status_code=404, detail="Цель не найдена")
+
+                if not goal['is_completed']:
+                    raise HTTPException(status_code=400, detail="Цель ещё не выполнена")
+
+                if goal['reward_claimed']:
+                    raise HTTPException(status_code=400, detail="Награда уже получена")
+
+                await conn.execute('''
+                UPDATE users
+                SET food_currency = food_currency + $1
+                WHERE user_id = $2
+                ''', goal['reward_amount'], user_id)
+
+                await conn.execute('''
+                UPDATE goals SET reward_claimed = TRUE WHERE goal_id = $1
+                ''', goal_id)
+            return goal['reward_amount']
+
+        return await self._write(user_id, claim)
+
+    # ---------- Транзакции ----------
+    async def transaction_stats(self, user_id: int):
+        async with self.read_pool(user_id).acquire() as conn:
+            return await fetch_stats(conn, user_id)
+
+    # ---------- Питомец ----------
+    async def pet_state(self, user_id: int):
+        async with self.read_pool(user_id).acquire() as conn:
+            row = await conn.fetchrow(PET_STATE_SQL, user_id)
+            return dict(row) if row else None
+
+    # ---------- Бюджет ----------
+    async def list_budgets(self, user_id: int = None):
+        if user_id:
+            async with self.fresh_pool().acquire() as conn:
+                return await conn.fetch('SELECT * FROM budgets WHERE user_id = $1', user_id)
+
+        async with self.read_pool().acquire() as conn:
+            return await conn.fetch('SELECT * FROM budgets')
+
+    async def close(self):
+        pass
+
+
+class PostgresStorage(Storage):
+    """PostgreSQL: проверки и изменения записей выполняются функциями БД (procedures.py)"""
+
+    backend = "postgres"
+
+    def __init__(self, pool, read_pool=None):
+        super().__init__(pool, read_pool)
+        if GROUP_COMMIT:
+            self.writes = UserWriteQueue(pool)
+
+    async def create_user(self, user):
+        async with self.pool.acquire() as conn:
+            try:
+                row = await conn.fetchrow('''
+                INSERT INTO users (name, email, registration_date, total_saved, current_balance, food_currency, pet_energy)
+                VALUES ($1, $2, COALESCE($3, CURRENT_DATE), $4, $5, $6, $7)
+                RETURNING *
+                ''', user.name, user.email, user.registration_date,
+                   user.total_saved, user.current_balance, user.food_currency, user.pet_energy)
+            except asyncpg.UniqueViolationError:
+                raise HTTPException(status_code=400, detail="Email уже существует")
+            except asyncpg.PostgresError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        return dict(row)
+
+    async def update_user(self, user_id: int, user):
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+            UPDATE users
+            SET name = $1, email = $2, registration_date = $3, total_saved = $4,
+                current_balance = $5, food_currency = $6, pet_energy = $7,
+                energy_updated_at = LOCALTIMESTAMP,
+                data_version = data_version + 1
+            WHERE user_id = $8
+            RETURNING *
+            ''', user.name, user.email, user.registration_date,
+               user.total_saved, user.current_balance, user.food_currency,
+               user.pet_energy, user_id)
+        return dict(row) if row else None
+
+    async def create_expense(self, expense):
+        async def create(conn):
+            # Проверка баланса, расход, баланс/энергия и транзакция — одним вызовом
+            with procedure_errors():
+                row = await conn.fetchrow(CREATE_EXPENSE_SQL, expense.user_id, expense.amount, expense.category,
+                                          expense.description, expense.date, expense.is_planned)
+            return dict(row)
+
+        return await self._write(expense.user_id, create)
+
+    async def create_income(self, income):
+        async def create(conn):
+            # Доход, баланс/энергия/корм и транзакция — одним вызовом
+            with procedure_errors():
+                row = await conn.fetchrow(CREATE_INCOME_SQL, income.user_id, income.amount, income.source,
+                                          income.date, income.is_recurring)
+            return dict(row)
+
+        return await self._write(income.user_id, create)
+
+    async def create_goal(self, goal):
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+            WITH inserted AS (
+                INSERT INTO goals (user_id, target_amount, current_amount, name, deadline, is_completed, reward_amount, reward_claimed)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                RETURNING *
+            ), bump AS (
+                UPDATE users SET data_version = data_version + 1 WHERE user_id = $1
+            )
+            SELECT * FROM inserted
+            ''', goal.user_id, goal.target_amount, goal.current_amount,
+               goal.name, goal.deadline, goal.is_completed, goal.reward_amount, goal.reward_claimed)
+        return dict(row)
+
+    async def add_money_to_goal(self, goal_id: int, user_id: int, amount: float, bonus: int):
+        async def add(conn):
+            with procedure_errors():
+                row = await conn.fetchrow('''
+                SELECT * FROM cp_add_money_to_goal($1, $2, $3, $4)
+                ''', goal_id, user_id, amount, bonus)
+            return dict(row)
+
+        return await self._write(user_id, add)
+
+    async def list_transactions(self, user_id: int, days: int = None,
+                                cursor: str = None, limit: int = None, stream: bool = False):
+        query = 'SELECT * FROM transactions WHERE user_id = $1'
+        params = [user_id]
+        if days:
+            query += " AND date >= NOW() - $2 * INTERVAL '1 day'"
+            params.append(days)
+
+        query = apply_keyset(query, params, 'transaction_id', cursor, limit)
+        if stream:
+            return stream_ndjson(self.pool, query, params), None
+
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+        return split_page(rows, limit, 'transaction_id')
+
+    async def feed_pet(self, user_id: int, food_amount: int, bonus: int):
+        async def feed(conn):
+            result = await conn.fetchrow(FEED_PET_SQL, food_amount, bonus, user_id)
+
+            if not result:
+                exists = await conn.fetchval('SELECT EXISTS(SELECT 1 FROM users WHERE user_id = $1)', user_id)
+                if not exists:
+                    raise HTTPException(status_code=404, detail="Пользователь не найден")
+                raise HTTPException(status_code=400, detail="Недостаточно корма")
+            return dict(result)
+
+        return await self._write(user_id, feed)
+
+    async def create_budget(self, budget):
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+            WITH inserted AS (
+                INSERT INTO budgets (user_id, category, amount, period, start_date, end_date)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                RETURNING *
+            ), bump AS (
+                UPDATE users SET data_version = data_version + 1 WHERE user_id = $1
+            )
+            SELECT * FROM inserted
+            ''', budget.user_id, budget.category, budget.amount,
+               budget.period, budget.start_date, budget.end_date)
+        return dict(row)
+
+    async def create_sample_user(self):
+        """Тестовый пользователь с целями и месяцем транзакций; None, если пользователи уже есть"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                count = await conn.fetchval('SELECT COUNT(*) FROM users')
+                if count > 0:
+                    return None
+
+                user_id = await conn.fetchval('''
+                INSERT INTO users (name, email, total_saved, current_balance, food_currency, pet_energy)
+                VALUES ('Иван Иванов', 'ivan@example.com', 50000, 150000, 100, 80)
+                RETURNING user_id
+                ''')
+
+                await conn.execute('''
+                INSERT INTO goals (user_id, target_amount, current_amount, name, deadline, reward_amount)
+                VALUES
+                ($1, 50000, 25000, 'Новый ноутбук', CURRENT_DATE + INTERVAL '3 months', 60),
+                ($1, 100000, 30000, 'Отпуск на море', CURRENT_DATE + INTERVAL '6 months', 80),
+                ($1, 1000000, 150000, 'Машина мечты', CURRENT_DATE + INTERVAL '1 year', 100)
+                ''', user_id)
+
+                await conn.executemany('''
+                INSERT INTO transactions (user_id, amount, type, category, date)
+                VALUES ($1, $2, $3, $4, $5)
+                ''', list(sample_transactions(user_id, datetime.now())))
+        return user_id
@@ -0,0 +1,38 @@
+import asyncio
+import os
+import sys
+import uuid
+
+import pytest
+
+# Модули сервера импортируются друг другом по имени, как в контейнере (WORKDIR /app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты с PostgreSQL (триггеры, функции БД) выполняются, только если задана тестовая база
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def postgres():
+    """Запуск scenario(conn) в отдельной схеме тестовой базы со всеми миграциями"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL не задан")
+    import asyncpg
+    from migrations import migrate
+
+    def run(scenario):
+        async def main():
+            conn = await asyncpg.connect(TEST_DATABASE_URL)
+            schema = f"cashpet_test_{uuid.uuid4().hex[:8]}"
+            await conn.execute(f'CREATE SCHEMA {schema}')
+            await conn.execute(f'SET search_path TO {schema}')
+            try:
+                await migrate(conn)
+                await scenario(conn)
+            finally:
+                await conn.execute(f'DROP SCHEMA {schema} CASCADE')
+                await conn.close()
+
+        asyncio.run(main())
+
+    return run
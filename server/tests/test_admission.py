@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+from admission import PriorityGate, route_priority
+
+
+def test_route_priority():
+    assert route_priority("POST", "/expenses/") == "critical"
+    assert route_priority("GET", "/expenses/") == "normal"
+    assert route_priority("GET", "/leaderboard") == "background"
+    assert route_priority("GET", "/metrics") is None
+
+
+def test_freed_slot_goes_to_highest_priority_then_first_come():
+    gate = PriorityGate(1)
+    order = []
+
+    async def wait(name, priority):
+        await gate.enter(priority)
+        order.append(name)
+        gate.leave()
+
+    async def scenario():
+        await gate.enter("critical")
+        waiters = [
+            asyncio.create_task(wait("background", "background")),
+            asyncio.create_task(wait("normal-1", "normal")),
+            asyncio.create_task(wait("critical", "critical")),
+            asyncio.create_task(wait("normal-2", "normal")),
+        ]
+        await asyncio.sleep(0)
+        assert gate.depth() == 4
+        gate.leave()
+        await asyncio.gather(*waiters)
+
+    asyncio.run(scenario())
+    assert order == ["critical", "normal-1", "normal-2", "background"]
+    assert gate.in_use == 0
+
+
+def test_long_queue_rejects_lower_priorities_first(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUE", 4)
+    gate = PriorityGate(1)
+
+    async def scenario():
+        await gate.enter("critical")
+        waiters = [asyncio.create_task(gate.enter("normal")) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        gate.check("critical")
+        with pytest.raises(HTTPException) as rejected:
+            gate.check("normal")
+        assert rejected.value.status_code == 503
+        assert "Retry-After" in rejected.value.headers
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_wait_timeout_is_503_and_does_not_leak_the_slot(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_ACQUIRE_TIMEOUT", 0.01)
+    gate = PriorityGate(1)
+
+    async def scenario():
+        await gate.enter("critical")
+        with pytest.raises(HTTPException) as rejected:
+            await gate.enter("background")
+        assert rejected.value.status_code == 503
+        gate.leave()
+        await gate.enter("background")
+
+    asyncio.run(scenario())
+    assert gate.in_use == 1
@@ -0,0 +1,53 @@
+import datetime
+from decimal import Decimal
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from batch import INSUFFICIENT_FUNDS, USER_NOT_FOUND, ingest_expenses, to_money, validate_batch
+
+
+class Item(BaseModel):
+    user_id: int
+    amount: float = Field(..., gt=0)
+    category: str = "Еда"
+    description: Optional[str] = None
+    date: datetime.date = datetime.date(2024, 5, 1)
+    is_planned: bool = False
+
+
+def test_to_money_rounds_like_numeric():
+    assert to_money(0.1 + 0.2) == Decimal("0.30")
+    assert to_money(2.675) == Decimal("2.68")
+    assert to_money(10) == Decimal("10.00")
+
+
+def test_invalid_items_do_not_reject_the_batch():
+    valid, errors = validate_batch(Item, [
+        {"user_id": 1, "amount": 5},
+        {"user_id": 1, "amount": -5},
+        {"amount": 5},
+    ])
+
+    assert [(index, item.amount) for index, item in valid] == [(0, 5)]
+    assert [error["index"] for error in errors] == [1, 2]
+    assert errors[0]["detail"].startswith("amount: ")
+    assert errors[1]["detail"].startswith("user_id: ")
+
+
+def test_expenses_are_checked_against_balance_in_request_order(postgres):
+    async def scenario(conn):
+        user_id = await conn.fetchval(
+            "INSERT INTO users (name, email, current_balance) VALUES ('Тест', 'batch@example.com', 100)"
+            " RETURNING user_id"
+        )
+        items = [Item(user_id=user_id, amount=amount) for amount in (60, 50, 40)] + [Item(user_id=0, amount=1)]
+
+        created, errors = await ingest_expenses(conn, list(enumerate(items)))
+
+        assert [row["amount"] for row in created] == [Decimal("60.00"), Decimal("40.00")]
+        assert errors == [{"index": 1, "detail": INSUFFICIENT_FUNDS}, {"index": 3, "detail": USER_NOT_FOUND}]
+        assert await conn.fetchval('SELECT current_balance FROM users WHERE user_id = $1', user_id) == 0
+        assert await conn.fetchval('SELECT COUNT(*) FROM transactions WHERE user_id = $1', user_id) == 2
+
+    postgres(scenario)
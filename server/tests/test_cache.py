@@ -0,0 +1,85 @@
+import asyncio
+
+from cache import MemoryBackend, UserCache
+
+
+def make_cache():
+    return UserCache(MemoryBackend(max_entries=100, ttl=60))
+
+
+def test_value_is_cached_after_load():
+    async def scenario():
+        cache = make_cache()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return {"balance": 10}
+
+        assert await cache.get_or_load("user", 1, loader) == {"balance": 10}
+        assert await cache.get_or_load("user", 1, loader) == {"balance": 10}
+        assert len(calls) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_during_load_keeps_stale_value_out():
+    async def scenario():
+        cache = make_cache()
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def stale_loader():
+            started.set()
+            await release.wait()
+            return {"balance": 10}
+
+        load = asyncio.create_task(cache.get_or_load("user", 1, stale_loader))
+        await started.wait()
+        await cache.invalidate_user(1)
+        release.set()
+
+        # Вызвавший получает загруженное, но в кэш значение не попадает
+        assert await load == {"balance": 10}
+        assert await cache.backend.get(cache._key("user", 1)) is None
+
+        async def fresh_loader():
+            return {"balance": 20}
+
+        assert await cache.get_or_load("user", 1, fresh_loader) == {"balance": 20}
+        assert await cache.get_or_load("user", 1, stale_loader) == {"balance": 20}
+
+    asyncio.run(scenario())
+
+
+def test_generations_are_dropped_when_loads_finish():
+    async def scenario():
+        cache = make_cache()
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return {"balance": 10}
+
+        loads = [asyncio.create_task(cache.get_or_load("user", 1, loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        await cache.invalidate_user(1, 2)
+        assert cache.generations == {1: 1}
+        release.set()
+        await asyncio.gather(*loads)
+        assert cache.generations == {} and cache.loading == {}
+
+    asyncio.run(scenario())
+
+
+def test_none_is_not_cached():
+    async def scenario():
+        cache = make_cache()
+
+        async def missing():
+            return None
+
+        assert await cache.get_or_load("user", 1, missing) is None
+        assert cache.backend.entries == {}
+
+    asyncio.run(scenario())
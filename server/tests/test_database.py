@@ -0,0 +1,96 @@
+import asyncio
+
+from database import ReadRouter, format_lsn, parse_lsn, record_write_lsn
+from timing import ReadAfter, TimedPool, read_after
+
+
+def test_lsn_round_trip():
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+    assert format_lsn(parse_lsn("16/B374D848")) == "16/B374D848"
+    assert parse_lsn(None) is None
+    assert parse_lsn("garbage") is None
+    assert parse_lsn("zz/1") is None
+
+
+def router(replay_lsn=0, healthy=True):
+    router = ReadRouter("primary", urls=["replica"])
+    router.replicas = ["replica"]
+    router.healthy = [healthy]
+    router.replay_lsn = [replay_lsn]
+    return router
+
+
+def route(router, token=None, user_id=None):
+    reset = read_after.set(token)
+    try:
+        return router.pool(user_id)
+    finally:
+        read_after.reset(reset)
+
+
+def test_reads_go_to_replica_that_applied_client_write():
+    assert route(router(replay_lsn=100), ReadAfter(100)) == "replica"
+    assert route(router(replay_lsn=100)) == "replica"
+
+
+def test_lagging_replicas_are_counted_separately_from_pinned_users():
+    lagging = router(replay_lsn=50)
+    assert route(lagging, ReadAfter(100)) == "primary"
+    lagging.pin(7)
+    assert route(lagging, user_id=7) == "primary"
+    assert route(router(healthy=False)) == "primary"
+
+    assert lagging.stats()["routing"] == {"replica": 0, "primary": 0, "pinned": 1, "lsn": 1}
+
+
+class FakeConnection:
+    def __init__(self, lsn="0/200"):
+        self.lsn = lsn
+        self.queries = []
+
+    async def fetchval(self, query):
+        self.queries.append(query)
+        return self.lsn
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.released = []
+
+    def get_max_size(self):
+        return 1
+
+    async def acquire(self, timeout=None):
+        return self.conn
+
+    async def release(self, conn):
+        self.released.append(conn)
+
+
+def test_write_lsn_is_read_on_the_writing_connection():
+    conn = FakeConnection()
+    pool = TimedPool(FakePool(conn))
+    pool.on_release = record_write_lsn
+    token = ReadAfter(0x100, writes=True)
+
+    async def scenario():
+        read_after.set(token)
+        async with pool.acquire() as acquired:
+            assert acquired is conn
+        return pool.pool.released
+
+    assert asyncio.run(scenario()) == [conn]
+    assert conn.queries == ['SELECT pg_current_wal_lsn()::text']
+    assert token.write_lsn == 0x200
+
+
+def test_reads_do_not_ask_for_write_lsn():
+    conn = FakeConnection()
+
+    async def scenario():
+        read_after.set(ReadAfter(0x100))
+        await record_write_lsn(conn)
+
+    asyncio.run(scenario())
+    assert conn.queries == []
@@ -0,0 +1,45 @@
+from starlette.requests import Request
+
+from etag import etag_matches, make_etag
+from wire import MSGPACK_MEDIA_TYPE, response_format
+
+
+def make_request(path="/users/1", query="", headers=None):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+
+def test_etag_depends_on_version_and_path_but_not_parameter_order():
+    etag = make_etag(1, 5, make_request(query="a=1&b=2"))
+    assert etag.startswith('W/"1-5-')
+    assert etag == make_etag(1, 5, make_request(query="b=2&a=1"))
+    assert etag != make_etag(1, 6, make_request(query="a=1&b=2"))
+    assert etag != make_etag(1, 5, make_request(query="a=1&b=3"))
+    assert etag != make_etag(1, 5, make_request(path="/pet/1", query="a=1&b=2"))
+    assert etag != make_etag(1, 5, make_request(query="a=1&b=2"), extra="page")
+
+
+def test_etag_depends_on_response_format():
+    request = make_request()
+    json_etag = make_etag(1, 5, request)
+    token = response_format.set(MSGPACK_MEDIA_TYPE)
+    try:
+        assert make_etag(1, 5, request) != json_etag
+    finally:
+        response_format.reset(token)
+
+
+def test_if_none_match_uses_weak_comparison():
+    etag = make_etag(1, 5, make_request())
+    strong = etag.removeprefix("W/")
+    assert etag_matches(make_request(headers={"If-None-Match": etag}), etag)
+    assert etag_matches(make_request(headers={"If-None-Match": strong}), etag)
+    assert etag_matches(make_request(headers={"If-None-Match": f'"other", {etag}'}), etag)
+    assert etag_matches(make_request(headers={"If-None-Match": "*"}), etag)
+    assert not etag_matches(make_request(headers={"If-None-Match": '"other"'}), etag)
+    assert not etag_matches(make_request(), etag)
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from forecast import forecast_user, project_goals, savings_rates
+
+TODAY = date(2024, 6, 1)
+
+
+def goal(user_id, goal_id, target, current, deadline=None):
+    return {"user_id": user_id, "goal_id": goal_id, "name": f"Цель {goal_id}",
+            "target_amount": target, "current_amount": current, "deadline": deadline}
+
+
+def test_savings_rates_for_steady_and_empty_history():
+    days = range(1, 91)
+    series = ([1] * 90, list(days), [10.0] * 90)
+
+    trend, recent = savings_rates([1, 2], series, history_days=90, window=30)
+
+    assert trend == pytest.approx([10.0, 0.0])
+    assert recent == pytest.approx([10.0, 0.0])
+
+
+def test_recent_rate_follows_the_last_window():
+    series = ([1] * 30, list(range(61, 91)), [5.0] * 30)
+    _, recent = savings_rates([1], series, history_days=90, window=30)
+    assert recent == pytest.approx([5.0])
+
+
+def test_goals_of_a_user_are_funded_in_deadline_order():
+    goals = [
+        goal(1, 10, 50, 0, deadline=TODAY + timedelta(days=12)),
+        goal(1, 11, 200, 100, deadline=TODAY + timedelta(days=14)),
+        goal(2, 20, 100, 100),
+        goal(2, 21, 100, 0, deadline=TODAY + timedelta(days=30)),
+    ]
+
+    first, second, reached, stalled = project_goals([1, 2], goals, np.array([10.0, 0.0]), TODAY)
+
+    assert (first["projected_date"], first["on_track"]) == (TODAY + timedelta(days=5), True)
+    assert (second["projected_date"], second["on_track"]) == (TODAY + timedelta(days=15), False)
+    assert (reached["remaining"], reached["projected_date"], reached["on_track"]) == (0, TODAY, None)
+    assert (stalled["projected_date"], stalled["on_track"]) == (None, False)
+
+
+class FakeConnection:
+    def __init__(self, series, goals):
+        self.series = series
+        self.goals = goals
+
+    async def fetchrow(self, query, *args):
+        return self.series
+
+    async def fetch(self, query, *args):
+        return self.goals
+
+
+def test_forecast_user_without_history():
+    conn = FakeConnection({"user_ids": None, "offsets": None, "net": None}, [goal(1, 10, 100, 0)])
+
+    forecast = asyncio.run(forecast_user(conn, 1, TODAY))
+
+    assert forecast["daily_savings_rate"] == 0
+    assert [item["projected_date"] for item in forecast["goals"]] == [None]
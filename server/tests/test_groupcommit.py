@@ -0,0 +1,143 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from database import record_write_lsn
+from groupcommit import USER_WRITE_LOCK_SPACE, USER_WRITE_LOCK_SQL, UserWriteQueue
+from metrics import GROUP_COMMIT_RETRIES
+from timing import ReadAfter, read_after
+
+
+class FakeConnection:
+    """Соединение, которое записывает BEGIN / SAVEPOINT / ROLLBACK и выполненные операции"""
+
+    def __init__(self):
+        self.log = []
+        self.depth = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.log.append("begin" if self.depth == 0 else "savepoint")
+        self.depth += 1
+        try:
+            yield
+        except Exception:
+            self.log.append("rollback" if self.depth == 1 else "rollback to savepoint")
+            raise
+        else:
+            self.log.append("commit" if self.depth == 1 else "release")
+        finally:
+            self.depth -= 1
+
+    async def execute(self, query, *args):
+        assert (query, args) == (USER_WRITE_LOCK_SQL, (USER_WRITE_LOCK_SPACE, 1))
+        self.log.append("lock")
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def write(name, fail=False):
+    async def op(conn):
+        conn.log.append(name)
+        if fail:
+            raise ValueError(name)
+        return name
+    return op
+
+
+def run_concurrently(queue, *ops):
+    async def scenario():
+        return await asyncio.gather(*(queue.submit(1, op) for op in ops), return_exceptions=True)
+    return asyncio.run(scenario())
+
+
+def test_single_write_runs_without_transaction_or_lock():
+    queue = UserWriteQueue(FakePool())
+    assert run_concurrently(queue, write("a")) == ["a"]
+    assert queue.pool.conn.log == ["a"]
+    assert queue.stats() == {"users_in_flight": 0, "queued": 0}
+
+
+def test_concurrent_writes_share_one_transaction():
+    queue = UserWriteQueue(FakePool())
+    assert run_concurrently(queue, write("a"), write("b"), write("c")) == ["a", "b", "c"]
+    assert queue.pool.conn.log == ["begin", "lock", "a", "b", "c", "commit"]
+
+
+def test_failed_write_is_retried_in_savepoints():
+    queue = UserWriteQueue(FakePool())
+    retries = GROUP_COMMIT_RETRIES.values.get((), 0)
+
+    a, failed, c = run_concurrently(queue, write("a"), write("b", fail=True), write("c"))
+
+    assert (a, c) == ("a", "c")
+    assert isinstance(failed, ValueError) and str(failed) == "b"
+    assert GROUP_COMMIT_RETRIES.values[()] == retries + 1
+    assert queue.pool.conn.log == [
+        "begin", "lock", "a", "b", "rollback",
+        "begin", "lock",
+        "savepoint", "a", "release",
+        "savepoint", "b", "rollback to savepoint",
+        "savepoint", "c", "release",
+        "commit",
+    ]
+
+
+def test_batches_are_capped_by_max_batch():
+    queue = UserWriteQueue(FakePool(), max_batch=2)
+    assert run_concurrently(queue, write("a"), write("b"), write("c")) == ["a", "b", "c"]
+    assert queue.pool.conn.log == ["begin", "lock", "a", "b", "commit", "c"]
+
+
+def test_connection_error_fails_every_write_in_the_batch():
+    class BrokenPool:
+        @asynccontextmanager
+        async def acquire(self):
+            raise ConnectionError("нет соединения")
+            yield
+
+    results = run_concurrently(UserWriteQueue(BrokenPool()), write("a"), write("b"))
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+@pytest.mark.parametrize("count", [1, 5])
+def test_queue_is_released_after_draining(count):
+    queue = UserWriteQueue(FakePool())
+    run_concurrently(queue, *(write(str(i)) for i in range(count)))
+    assert queue.tasks == {} and queue.pending == {}
+
+
+def test_batch_write_lsn_reaches_every_caller():
+    class LsnConnection(FakeConnection):
+        async def fetchval(self, query):
+            return "0/300"
+
+    pool = FakePool()
+    pool.conn = LsnConnection()
+
+    @asynccontextmanager
+    async def acquire():
+        yield pool.conn
+        await record_write_lsn(pool.conn)
+
+    pool.acquire = acquire
+    queue = UserWriteQueue(pool)
+    tokens = [ReadAfter(writes=True) for _ in range(3)]
+
+    async def submit(token, op):
+        read_after.set(token)
+        return await queue.submit(1, op)
+
+    async def scenario():
+        return await asyncio.gather(*(submit(token, write(name)) for token, name in zip(tokens, "abc")))
+
+    assert asyncio.run(scenario()) == ["a", "b", "c"]
+    assert [token.write_lsn for token in tokens] == [0x300] * 3
@@ -0,0 +1,42 @@
+from datetime import date, datetime
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import apply_keyset, decode_cursor, encode_cursor, split_page
+
+
+@pytest.mark.parametrize("value", [date(2026, 3, 1), datetime(2026, 3, 1, 14, 30, 5)])
+def test_cursor_round_trip(value):
+    cursor = encode_cursor(value, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (value, 42)
+    assert type(decode_cursor(cursor)[0]) is type(value)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(date(2026, 1, 1), 1)[:-3]])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_apply_keyset_appends_condition_and_limit():
+    params = [7]
+    cursor = encode_cursor(date(2026, 2, 1), 10)
+    query = apply_keyset('SELECT * FROM expenses WHERE user_id = $1', params, 'expense_id', cursor, 50)
+    assert query == (
+        'SELECT * FROM expenses WHERE user_id = $1 AND (date, expense_id) < ($2, $3)'
+        ' ORDER BY date DESC, expense_id DESC LIMIT $4'
+    )
+    assert params == [7, date(2026, 2, 1), 10, 51]
+
+
+def test_split_page_returns_cursor_of_last_row():
+    rows = [{"date": date(2026, 1, day), "id": day} for day in (5, 4, 3)]
+    page, cursor = split_page(rows, 2, "id")
+    assert page == rows[:2]
+    assert decode_cursor(cursor) == (date(2026, 1, 4), 4)
+
+    page, cursor = split_page(rows, 3, "id")
+    assert page == rows and cursor is None
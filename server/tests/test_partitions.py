@@ -0,0 +1,62 @@
+import gzip
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from partitions import _csv_records, _read_archive_file
+
+HEADER = "transaction_id,user_id,amount,type,category,date,description\n"
+
+
+def write_archive(path, *lines):
+    with gzip.open(path, "wt", newline="") as archive:
+        archive.write(HEADER + "".join(lines))
+    return str(path)
+
+
+def test_records_distinguish_null_from_literal_marker():
+    lines = ['"1","\\N",\\N,""\n']
+    assert list(_csv_records(lines)) == [["1", "\\N", None, ""]]
+
+
+def test_records_unescape_quotes_and_join_embedded_newlines():
+    lines = ['"1","say ""hi""","first\n', 'second\n', 'third",x\n', '"2",,\\N\n']
+    assert list(_csv_records(lines)) == [
+        ["1", 'say "hi"', "first\nsecond\nthird", "x"],
+        ["2", "", None],
+    ]
+
+
+def test_records_reject_unterminated_quote():
+    with pytest.raises(ValueError):
+        list(_csv_records(['"1","open\n']))
+
+
+def test_read_archive_file_round_trips_force_quoted_copy(tmp_path):
+    path = write_archive(
+        tmp_path / "transactions_2025_01.csv.gz",
+        '"1","7","12.50","expense","food","2025-01-03 10:00:00",\\N\n',
+        '"2","7","3.00","expense","food","2025-01-04 10:00:00","\\N"\n',
+        '"3","7","8.00","income","job","2025-01-05 10:00:00","line 1\n', 'line ""2"""\n',
+        '"4","8","1.00","expense","food","2025-01-05 10:00:00",""\n',
+        '"5","7","1.00","expense","food","2025-02-01 00:00:00","late"\n',
+    )
+    rows = _read_archive_file(path, 7, datetime(2025, 1, 1), datetime(2025, 1, 31, 23, 59))
+    assert [row["transaction_id"] for row in rows] == [1, 2, 3]
+    assert [row["description"] for row in rows] == [None, "\\N", 'line 1\nline "2"']
+    assert rows[0]["amount"] == Decimal("12.50")
+    assert rows[0]["date"] == datetime(2025, 1, 3, 10, 0)
+
+
+def test_read_archive_file_reads_archives_written_without_force_quote(tmp_path):
+    # Прежний формат: кавычки только там, где без них нельзя, и у текста, равного \N
+    path = write_archive(
+        tmp_path / "transactions_2024_12.csv.gz",
+        '1,7,12.50,expense,food,2024-12-03 10:00:00,\\N\n',
+        '2,7,3.00,expense,food,2024-12-04 10:00:00,"\\N"\n',
+        '3,7,4.00,expense,"food, misc",2024-12-05 10:00:00,""\n',
+    )
+    rows = _read_archive_file(path, 7, datetime(2024, 12, 1), datetime(2024, 12, 31))
+    assert [row["description"] for row in rows] == [None, "\\N", ""]
+    assert rows[2]["category"] == "food, misc"
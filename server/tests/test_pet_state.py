@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from pet_state import HUNGER_PER_HOUR, MAX_ENERGY, energy_anchor, energy_at
+
+T0 = datetime(2026, 1, 1, 12, 0)
+POINT = timedelta(seconds=3600 // HUNGER_PER_HOUR)
+
+
+def test_energy_at_subtracts_whole_hunger_points():
+    assert energy_at(80, T0, T0) == 80
+    assert energy_at(80, T0, T0 + POINT - timedelta(seconds=1)) == 80
+    assert energy_at(80, T0, T0 + POINT) == 79
+    assert energy_at(80, T0, T0 + timedelta(hours=2)) == 80 - 2 * HUNGER_PER_HOUR
+
+
+def test_energy_at_clamps_to_range():
+    assert energy_at(5, T0, T0 + timedelta(days=3)) == 0
+    assert energy_at(MAX_ENERGY + 50, T0, T0) == MAX_ENERGY
+    assert energy_at(MAX_ENERGY + 50, None) == MAX_ENERGY
+    assert energy_at(-3, None) == 0
+
+
+def test_energy_at_ignores_clock_skew():
+    assert energy_at(60, T0, T0 - timedelta(hours=1)) == 60
+
+
+def test_energy_anchor_keeps_partial_point():
+    now = T0 + POINT * 3 + timedelta(seconds=100)
+    assert energy_anchor(T0, now) == T0 + POINT * 3
+    assert energy_anchor(T0, T0 - timedelta(minutes=5)) == T0
+    assert energy_anchor(None, now) == now
+
+
+@pytest.mark.parametrize("mutation_seconds", [0, 59, 359, 360, 361, 1000, 7199, 36000])
+def test_normalizing_at_a_mutation_does_not_change_later_energy(mutation_seconds):
+    """Нормализация на момент мутации (без изменения энергии) не теряет неполный пункт голода"""
+    mutation = T0 + timedelta(seconds=mutation_seconds)
+    energy = energy_at(90, T0, mutation)
+    anchor = energy_anchor(T0, mutation)
+    for later in (mutation, mutation + timedelta(seconds=1), mutation + POINT, mutation + timedelta(hours=3)):
+        assert energy_at(energy, anchor, later) == energy_at(90, T0, later)
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from rollups import ArchivedHistoryError, check_rollups, fetch_stats, rebuild_rollups
+
+
+class ArchivedConnection:
+    """Соединение, у которого в transaction_archives есть строки"""
+
+    def __init__(self):
+        self.executed = []
+
+    async def fetchval(self, query, *args):
+        return True
+
+    async def execute(self, query, *args):
+        self.executed.append(query)
+
+
+def test_rebuild_refuses_when_history_is_archived():
+    conn = ArchivedConnection()
+    with pytest.raises(ArchivedHistoryError):
+        asyncio.run(rebuild_rollups(conn))
+    assert conn.executed == []
+
+
+async def insert_transactions(conn, user_id, *rows):
+    await conn.executemany('''
+    INSERT INTO transactions (user_id, amount, type, category, date, description)
+    VALUES ($1, $2, $3, $4, $5, NULL)
+    ''', [(user_id, Decimal(amount), kind, category, at) for amount, kind, category, at in rows])
+
+
+def test_trigger_keeps_rollups_in_step_with_transactions(postgres):
+    async def scenario(conn):
+        user_id = await conn.fetchval(
+            "INSERT INTO users (name, email) VALUES ('Тест', 'rollups@example.com') RETURNING user_id"
+        )
+        today = datetime.combine(date.today(), datetime.min.time())
+        await insert_transactions(
+            conn, user_id,
+            ("100.00", "income", "job", today),
+            ("30.50", "expense", "food", today),
+            ("9.50", "expense", "food", today),
+            ("20.00", "expense", "fun", today),
+        )
+
+        stats = await fetch_stats(conn, user_id)
+        assert stats["totals"] == {"total_income": 100, "total_expense": 60}
+        assert {row["category"]: row["total"] for row in stats["categories"]} == {"food": 40, "fun": 20}
+        assert [(row["income"], row["expense"]) for row in stats["daily"]] == [(100, 60)]
+        assert await check_rollups(conn) == []
+
+        await rebuild_rollups(conn)
+        assert await fetch_stats(conn, user_id) == stats
+
+    postgres(scenario)
+
+
+def test_rebuild_with_archived_history_needs_force(postgres):
+    async def scenario(conn):
+        user_id = await conn.fetchval(
+            "INSERT INTO users (name, email) VALUES ('Тест', 'archive@example.com') RETURNING user_id"
+        )
+        await insert_transactions(conn, user_id, ("50.00", "income", "job", datetime.now()))
+        await conn.execute('''
+        INSERT INTO transaction_archives (partition_name, range_start, range_end, file_name, row_count)
+        VALUES ('transactions_2000_01', '2000-01-01', '2000-02-01', 'transactions_2000_01.csv.gz', 1)
+        ''')
+        await conn.execute('UPDATE user_totals SET total_income = total_income + 25 WHERE user_id = $1', user_id)
+
+        with pytest.raises(ArchivedHistoryError):
+            await rebuild_rollups(conn)
+        assert (await fetch_stats(conn, user_id))["totals"]["total_income"] == 75
+
+        await rebuild_rollups(conn, force=True)
+        assert (await fetch_stats(conn, user_id))["totals"]["total_income"] == 50
+
+    postgres(scenario)
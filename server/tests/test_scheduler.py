@@ -0,0 +1,128 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+from decimal import Decimal
+
+import scheduler
+from scheduler import Scheduler, materialize_recurring_incomes, roll_budget_periods
+
+
+class FakeConnection:
+    """Соединение задачи: MAX(user_id) и pg_try_advisory_xact_lock по списку ответов"""
+
+    def __init__(self, max_user_id=0, locks=()):
+        self.max_user_id = max_user_id
+        self.locks = list(locks)
+        self.closed = False
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetchval(self, query, *args):
+        if "MAX(user_id)" in query:
+            return self.max_user_id
+        return self.locks.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.acquired = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.acquired += 1
+        yield self.conn
+
+
+def test_job_runs_by_user_ranges_and_skips_locked_ones(monkeypatch):
+    ranges = []
+
+    async def job(conn, first_user_id, last_user_id, today):
+        ranges.append((first_user_id, last_user_id))
+        return 2, [first_user_id + 1]
+
+    monkeypatch.setitem(scheduler.JOBS, "recurring_incomes", job)
+    changed = []
+
+    async def on_users_changed(*user_ids):
+        changed.extend(user_ids)
+
+    conn = FakeConnection(max_user_id=250, locks=[True, False, True])
+    jobs = Scheduler(FakePool(conn), "dsn", chunk_size=100, on_users_changed=on_users_changed)
+
+    assert asyncio.run(jobs.run_job("recurring_incomes", date(2024, 3, 1))) == 4
+    assert ranges == [(0, 99), (200, 299)]
+    assert changed == [1, 201]
+    stats = jobs.stats()["recurring_incomes"]
+    assert (stats["runs"], stats["rows"], stats["skipped_chunks"], stats["errors"]) == (1, 4, 1, 0)
+
+
+def test_job_error_is_recorded_not_raised(monkeypatch):
+    async def job(conn, first_user_id, last_user_id, today):
+        raise RuntimeError("сбой")
+
+    monkeypatch.setitem(scheduler.JOBS, "budget_rollover", job)
+    jobs = Scheduler(FakePool(FakeConnection(locks=[True])), "dsn")
+
+    assert asyncio.run(jobs.run_job("budget_rollover")) == 0
+    stats = jobs.stats()["budget_rollover"]
+    assert (stats["errors"], stats["last_error"]) == (1, "сбой")
+
+
+def test_maintenance_lock_is_held_outside_the_pool(monkeypatch):
+    lock_conns, locks = [], [True, False]
+
+    async def connect(dsn):
+        lock_conns.append(FakeConnection(locks=[locks.pop(0)]))
+        return lock_conns[-1]
+
+    async def job(conn, today):
+        return 3
+
+    monkeypatch.setattr(scheduler.asyncpg, "connect", connect)
+    monkeypatch.setitem(scheduler.MAINTENANCE_JOBS, "leaderboard", job)
+    pool = FakePool(FakeConnection())
+    jobs = Scheduler(pool, "dsn")
+
+    assert asyncio.run(jobs.run_job("leaderboard")) == 3
+    assert pool.acquired == 1 and lock_conns[0].closed
+
+    assert asyncio.run(jobs.run_job("leaderboard")) == 0
+    assert pool.acquired == 1 and lock_conns[1].closed
+    assert jobs.stats()["leaderboard"]["skipped_chunks"] == 1
+
+
+def test_recurring_income_and_budget_rollover(postgres):
+    async def scenario(conn):
+        user_id = await conn.fetchval(
+            "INSERT INTO users (name, email) VALUES ('Тест', 'scheduler@example.com') RETURNING user_id"
+        )
+        await conn.execute('''
+        INSERT INTO incomes (user_id, amount, source, date, is_recurring) VALUES ($1, 1000, 'Зарплата', '2024-01-15', TRUE)
+        ''', user_id)
+        await conn.execute('''
+        INSERT INTO budgets (user_id, category, amount, period, start_date) VALUES ($1, 'Еда', 500, 'month', '2024-01-01')
+        ''', user_id)
+        today = date(2024, 3, 20)
+
+        async with conn.transaction():
+            assert await materialize_recurring_incomes(conn, 0, user_id, today) == (2, [user_id])
+        async with conn.transaction():
+            assert await materialize_recurring_incomes(conn, 0, user_id, today) == (0, [])
+        dates = await conn.fetch(
+            'SELECT date FROM incomes WHERE recurring_source_id IS NOT NULL ORDER BY date'
+        )
+        assert [row['date'] for row in dates] == [date(2024, 2, 15), date(2024, 3, 15)]
+        assert await conn.fetchval('SELECT current_balance FROM users WHERE user_id = $1', user_id) == Decimal(2000)
+
+        async with conn.transaction():
+            assert await roll_budget_periods(conn, 0, user_id, today) == (1, [user_id])
+        period = await conn.fetchrow('SELECT start_date, end_date FROM budgets WHERE user_id = $1', user_id)
+        assert (period['start_date'], period['end_date']) == (date(2024, 3, 1), date(2024, 3, 31))
+
+    postgres(scenario)
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def counting_loader(calls, result="data", fail=False):
+    async def load():
+        calls.append(result)
+        await asyncio.sleep(0.01)
+        if fail:
+            raise ValueError(result)
+        return result
+    return load
+
+
+def test_concurrent_reads_share_one_load():
+    flight, calls = SingleFlight(), []
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do(("goals", 1), counting_loader(calls)) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == ["data"] * 3
+    assert calls == ["data"]
+    assert flight.calls == {}
+
+
+def test_results_are_not_cached():
+    flight, calls = SingleFlight(), []
+
+    async def scenario():
+        await flight.do(("goals", 1), counting_loader(calls, "first"))
+        return await flight.do(("goals", 1), counting_loader(calls, "second"))
+
+    assert asyncio.run(scenario()) == "second"
+    assert calls == ["first", "second"]
+
+
+def test_error_reaches_every_waiter():
+    flight, calls = SingleFlight(), []
+
+    async def scenario():
+        return await asyncio.gather(
+            *(flight.do(("goals", 1), counting_loader(calls, fail=True)) for _ in range(2)),
+            return_exceptions=True,
+        )
+
+    assert [type(result) for result in asyncio.run(scenario())] == [ValueError, ValueError]
+    assert len(calls) == 1
+
+
+def test_cancelled_leader_does_not_cancel_the_load():
+    flight, calls = SingleFlight(), []
+
+    async def scenario():
+        leader = asyncio.create_task(flight.do(("goals", 1), counting_loader(calls)))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do(("goals", 1), counting_loader(calls)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "data"
+    assert calls == ["data"]
+
+
+def test_forget_starts_a_new_load_after_a_write():
+    flight, calls = SingleFlight(), []
+
+    async def scenario():
+        before = asyncio.create_task(flight.do(("goals", 1), counting_loader(calls, "before")))
+        other = asyncio.create_task(flight.do(("goals", 2), counting_loader(calls, "other")))
+        await asyncio.sleep(0)
+        flight.forget(1)
+        assert list(flight.calls) == [("goals", 2)]
+        after = await flight.do(("goals", 1), counting_loader(calls, "after"))
+        return await before, await other, after
+
+    assert asyncio.run(scenario()) == ("before", "other", "after")
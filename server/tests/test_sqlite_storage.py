@@ -0,0 +1,118 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from sqlite_storage import SqliteStorage
+
+
+def user(email="test@example.com", balance=100.0):
+    return SimpleNamespace(name="Тест", email=email, registration_date=None, total_saved=0.0,
+                           current_balance=balance, food_currency=100, pet_energy=50)
+
+
+def expense(user_id, amount, category="Еда", day=None):
+    return SimpleNamespace(user_id=user_id, amount=amount, category=category, description=None,
+                           date=day or date.today(), is_planned=False)
+
+
+def income(user_id, amount, source="Зарплата"):
+    return SimpleNamespace(user_id=user_id, amount=amount, source=source, date=date.today(), is_recurring=False)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """run(scenario) с хранилищем SQLite во временном файле"""
+    def run(scenario):
+        async def main():
+            storage = await SqliteStorage.open(str(tmp_path / "cashpet.db"), readers=2)
+            try:
+                return await scenario(storage)
+            finally:
+                await storage.close()
+
+        return asyncio.run(main())
+
+    return run
+
+
+def test_expenses_and_incomes_update_balance_and_stats(storage):
+    async def scenario(storage):
+        user_id = (await storage.create_user(user()))["user_id"]
+        version = await storage.user_version(user_id)
+
+        await storage.create_expense(expense(user_id, 30.123))
+        await storage.create_income(income(user_id, 50))
+        with pytest.raises(HTTPException) as refused:
+            await storage.create_expense(expense(user_id, 1000))
+        assert refused.value.status_code == 400
+
+        assert (await storage.get_user(user_id))["current_balance"] == pytest.approx(119.88)
+        assert await storage.user_version(user_id) == version + 2
+
+        stats = await storage.transaction_stats(user_id)
+        assert stats["totals"] == {"total_income": 50, "total_expense": pytest.approx(30.12)}
+        assert [row["category"] for row in stats["categories"]] == ["Еда"]
+        assert len(stats["daily"]) == 1
+
+    storage(scenario)
+
+
+def test_unknown_user_and_duplicate_email(storage):
+    async def scenario(storage):
+        await storage.create_user(user())
+        with pytest.raises(HTTPException) as duplicate:
+            await storage.create_user(user())
+        assert duplicate.value.status_code == 400
+
+        with pytest.raises(HTTPException) as missing:
+            await storage.create_expense(expense(999, 10))
+        assert missing.value.status_code == 404
+
+    storage(scenario)
+
+
+def test_goal_completion_and_reward(storage):
+    async def scenario(storage):
+        user_id = (await storage.create_user(user()))["user_id"]
+        goal = await storage.create_goal(SimpleNamespace(
+            user_id=user_id, target_amount=80, current_amount=0, name="Велосипед", deadline=None,
+            is_completed=False, reward_amount=40, reward_claimed=False,
+        ))
+
+        with pytest.raises(HTTPException):
+            await storage.claim_goal_reward(goal["goal_id"], user_id)
+        updated = await storage.add_money_to_goal(goal["goal_id"], user_id, 80, bonus=5)
+        assert updated["is_completed"] is True
+
+        assert await storage.claim_goal_reward(goal["goal_id"], user_id) == 40
+        assert (await storage.get_user(user_id))["food_currency"] == 145
+
+    storage(scenario)
+
+
+def test_transactions_are_paged_by_keyset(storage):
+    async def scenario(storage):
+        user_id = (await storage.create_user(user(balance=1000)))["user_id"]
+        for amount in (1, 2, 3):
+            await storage.create_expense(expense(user_id, amount))
+
+        first, cursor = await storage.list_transactions(user_id, limit=2)
+        rest, end = await storage.list_transactions(user_id, cursor=cursor, limit=2)
+        return [row["amount"] for row in first + rest], end
+
+    amounts, end = storage(scenario)
+    assert sorted(amounts) == [1, 2, 3] and end is None
+
+
+def test_data_survives_reopening(storage):
+    async def create(storage):
+        return (await storage.create_user(user()))["user_id"]
+
+    async def read(storage):
+        return await storage.get_user(user_id)
+
+    user_id = storage(create)
+    assert storage(read)["email"] == "test@example.com"
@@ -0,0 +1,53 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+from timing import InstrumentedConnection
+
+
+class FakeStatement:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def fetchrow(self, *args, **kwargs):
+        self.calls.append(args)
+        if self.error:
+            raise self.error
+        return {"prepared": args}
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    plain_calls = []
+
+    async def plain_fetchrow(self, query, *args, **kwargs):
+        plain_calls.append((query, args))
+        return {"plain": args}
+
+    monkeypatch.setattr(asyncpg.Connection, "fetchrow", plain_fetchrow)
+    # Без подключения к серверу: только то, что нужно методам выполнения и __del__
+    conn = object.__new__(InstrumentedConnection)
+    conn._aborted = True
+    conn.plain_calls = plain_calls
+    return conn
+
+
+def test_warmed_query_runs_its_prepared_statement(connection):
+    statement = FakeStatement()
+    connection._prepared = {"SELECT $1": statement}
+
+    assert asyncio.run(connection.fetchrow("SELECT $1", 5)) == {"prepared": (5,)}
+    assert asyncio.run(connection.fetchrow("SELECT 2", 6)) == {"plain": (6,)}
+    assert statement.calls == [(5,)]
+    assert connection.plain_calls == [("SELECT 2", (6,))]
+
+
+def test_invalidated_statement_falls_back_to_plain_path(connection):
+    statement = FakeStatement(asyncpg.InvalidCachedStatementError("cached plan must not change result type"))
+    connection._prepared = {"SELECT $1": statement}
+
+    assert asyncio.run(connection.fetchrow("SELECT $1", 5)) == {"plain": (5,)}
+    assert connection._prepared == {}
+    assert connection.plain_calls == [("SELECT $1", (5,))]
@@ -0,0 +1,106 @@
+import asyncio
+import gzip
+from decimal import Decimal
+
+import pytest
+
+import wire
+from wire import (
+    CBOR_MEDIA_TYPE, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, WireMiddleware, encode,
+    negotiate_encoding, negotiate_format,
+)
+
+
+@pytest.fixture
+def binary_formats(monkeypatch):
+    """Согласование так, будто msgpack и cbor2 установлены"""
+    monkeypatch.setattr(wire, "msgpack", object())
+    monkeypatch.setattr(wire, "cbor2", object())
+
+
+def test_json_without_accept_or_for_unknown_types(binary_formats):
+    assert negotiate_format(None) == JSON_MEDIA_TYPE
+    assert negotiate_format("text/html") == JSON_MEDIA_TYPE
+    assert negotiate_format("*/*") == JSON_MEDIA_TYPE
+
+
+def test_binary_format_by_quality_and_alias(binary_formats):
+    assert negotiate_format("application/x-msgpack") == MSGPACK_MEDIA_TYPE
+    assert negotiate_format("application/json;q=0.5, application/cbor") == CBOR_MEDIA_TYPE
+    assert negotiate_format("application/msgpack;q=0, application/cbor;q=0.1") == CBOR_MEDIA_TYPE
+
+
+def test_binary_formats_need_their_packages(monkeypatch):
+    monkeypatch.setattr(wire, "msgpack", None)
+    assert negotiate_format("application/msgpack") == JSON_MEDIA_TYPE
+
+
+def test_encoding_prefers_brotli_on_equal_weight(monkeypatch):
+    monkeypatch.setattr(wire, "brotli", object())
+    assert negotiate_encoding("gzip, br") == "br"
+    assert negotiate_encoding("br;q=0.5, gzip") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("*") == "br"
+
+    monkeypatch.setattr(wire, "brotli", None)
+    assert negotiate_encoding("br") is None
+    assert negotiate_encoding("br, gzip") == "gzip"
+    assert negotiate_encoding(None) is None
+
+
+def test_binary_encoding_of_decimals_and_dates():
+    msgpack = pytest.importorskip("msgpack")
+    cbor2 = pytest.importorskip("cbor2")
+    data = {"amount": Decimal("12.50"), "items": [1, None]}
+
+    assert msgpack.unpackb(encode(data, MSGPACK_MEDIA_TYPE, str)) == {"amount": "12.50", "items": [1, None]}
+    assert cbor2.loads(encode(data, CBOR_MEDIA_TYPE, str)) == {"amount": "12.50", "items": [1, None]}
+
+
+def respond(body: bytes, content_type="application/json", accept_encoding="gzip", chunks=1):
+    """Ответ приложения, прошедший через WireMiddleware: (заголовки, тело, число отправок тела)"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", content_type.encode()),
+                                (b"content-length", str(len(body)).encode())]})
+        size = len(body) // chunks
+        for index in range(chunks):
+            part = body[index * size:] if index == chunks - 1 else body[index * size:(index + 1) * size]
+            await send({"type": "http.response.body", "body": part, "more_body": index < chunks - 1})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(WireMiddleware(app)(scope, None, send))
+    headers = {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+    return headers, b"".join(message["body"] for message in sent[1:]), len(sent) - 1
+
+
+def test_large_response_is_gzipped():
+    body = b'{"items": "' + b"x" * 4096 + b'"}'
+    headers, compressed, _ = respond(body)
+
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(compressed))
+    assert "Accept-Encoding" in headers["vary"]
+    assert gzip.decompress(compressed) == body
+
+
+def test_small_and_event_stream_responses_are_not_compressed():
+    headers, body, _ = respond(b'{"ok": true}')
+    assert "content-encoding" not in headers and body == b'{"ok": true}'
+
+    headers, _, _ = respond(b"data: x\n\n" * 500, content_type="text/event-stream")
+    assert "content-encoding" not in headers
+
+
+def test_streamed_response_is_compressed_chunk_by_chunk():
+    body = b"".join(b'{"row": %d}\n' % index for index in range(100))
+    headers, compressed, sends = respond(body, content_type="application/x-ndjson", chunks=4)
+
+    assert headers["content-encoding"] == "gzip" and "content-length" not in headers
+    assert sends == 4
+    assert gzip.decompress(compressed) == body
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+import asyncpg
+
+from admission import ADMISSION_ENABLED, PriorityGate, request_priority
+from metrics import (
+    DB_QUERY_DURATION, DB_QUERY_ERRORS, DB_QUERY_INFO, DB_QUERY_ROWS,
+    POOL_ACQUIRE_WAIT, POOL_CONNECTIONS, POOL_SATURATION, POOL_WAITING,
+)
+
+# Порог журнала медленных запросов, мс (0 — журнал выключен)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+# Максимум различных отпечатков SQL в метриках; остальные попадают в "other"
+MAX_QUERY_FINGERPRINTS = 500
+
+
+class RequestTiming:
+    """Время, проведённое запросом в ожидании пула и в SQL (секунды)"""
+
+    __slots__ = ("pool_wait", "db_time")
+
+    def __init__(self):
+        self.pool_wait = 0.0
+        self.db_time = 0.0
+
+
+# Учёт текущего HTTP-запроса; объект изменяемый, чтобы его видели и вложенные задачи
+request_timing: ContextVar = ContextVar("request_timing", default=None)
+
+
+class ReadAfter:
+    """LSN, который должны видеть чтения запроса (от клиента), и LSN записей запроса (для клиента).
+
+    writes — запрос может писать: соединения первичной базы перед возвратом в пул
+    сообщают свой LSN (record_write_lsn).
+    """
+
+    def __init__(self, min_lsn: int = None, writes: bool = False):
+        self.min_lsn = min_lsn
+        self.writes = writes
+        self.write_lsn = None
+
+    def wrote(self, lsn: int):
+        self.write_lsn = max(lsn, self.write_lsn or 0, self.min_lsn or 0)
+
+
+# Состояние read-your-writes текущего HTTP-запроса; вне запросов (планировщик) — None
+read_after: ContextVar = ContextVar("read_after", default=None)
+
+
+_COMMENT = re.compile(r"--[^\n]*")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAM = re.compile(r"\$\d+")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+_known_queries = set()
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(query: str):
+    """Отпечаток SQL: литералы и параметры заменены на ?, пробелы схлопнуты.
+
+    Возвращает (query_id, нормализованный текст).
+    """
+    text = _COMMENT.sub(" ", query)
+    text = _STRING.sub("?", text)
+    text = _PARAM.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _SPACE.sub(" ", text).strip()
+    return hashlib.blake2b(text.encode(), digest_size=6).hexdigest(), text
+
+
+def observe_query(query: str, elapsed: float, rows: int, failed: bool = False):
+    query_id, text = fingerprint(query)
+    if query_id not in _known_queries:
+        if len(_known_queries) >= MAX_QUERY_FINGERPRINTS:
+            query_id = "other"
+        else:
+            _known_queries.add(query_id)
+            DB_QUERY_INFO.set((query_id, text[:300]), 1)
+
+    labels = (query_id,)
+    DB_QUERY_DURATION.observe(labels, elapsed)
+    DB_QUERY_ROWS.inc(labels, rows)
+    if failed:
+        DB_QUERY_ERRORS.inc(labels)
+
+    timing = request_timing.get()
+    if timing is not None:
+        timing.db_time += elapsed
+
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        print(f"🐢 Медленный запрос {query_id}: {elapsed * 1000:.1f} мс, строк {rows}: {text[:300]}")
+
+
+def _status_rows(status) -> int:
+    # Статус команды вида "INSERT 0 5", "UPDATE 3", "COPY 100"
+    if isinstance(status, str):
+        last = status.rsplit(" ", 1)[-1]
+        return int(last) if last.isdigit() else 0
+    return 0
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """Соединение asyncpg с учётом времени и числа строк каждого запроса"""
+
+    async def _timed(self, call, query, count_rows, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = await call(query, *args, **kwargs)
+        except Exception:
+            observe_query(query, time.perf_counter() - started, 0, failed=True)
+            raise
+        observe_query(query, time.perf_counter() - started, count_rows(result))
+        return result
+
+    # Заранее подготовленные частые запросы: текст запроса -> PreparedStatement
+    _prepared = None
+
+    async def warm_statement_cache(self, queries):
+        """Подготовка запросов заранее: первый вызов в обработчике не тратит round trip на PREPARE.
+
+        prepare() не кладёт оператор в кэш, которым пользуются fetch*, поэтому
+        подготовленные операторы хранятся отдельно, и fetch/fetchrow/fetchval
+        с тем же текстом выполняют их.
+        """
+        self._prepared = {query: await self.prepare(query) for query in queries}
+
+    def _call(self, method: str, query):
+        plain = getattr(super(), method)
+        statement = self._prepared.get(query) if self._prepared else None
+        if statement is None:
+            return plain
+
+        async def prepared(query, *args, **kwargs):
+            try:
+                return await getattr(statement, method)(*args, **kwargs)
+            except asyncpg.InvalidCachedStatementError:
+                # Схема изменилась (например, тип результата): дальше — обычным путём,
+                # который сам переподготавливает оператор
+                self._prepared.pop(query, None)
+                return await plain(query, *args, **kwargs)
+
+        return prepared
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(super().execute, query, _status_rows, *args, **kwargs)
+
+    async def executemany(self, command, args, **kwargs):
+        return await self._timed(super().executemany, command, lambda _: len(args), args, **kwargs)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(self._call("fetch", query), query, len, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(self._call("fetchrow", query), query,
+                                 lambda row: int(row is not None), *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(self._call("fetchval", query), query,
+                                 lambda value: int(value is not None), *args, **kwargs)
+
+    async def copy_records_to_table(self, table_name, **kwargs):
+        return await self._timed(super().copy_records_to_table, f"COPY {table_name}", _status_rows, **kwargs)
+
+
+class _TimedAcquire:
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        gate = self._pool.gate
+        self._pool.waiting += 1
+        try:
+            if gate:
+                await gate.enter(request_priority.get())
+            try:
+                self._conn = await self._pool.pool.acquire(timeout=self._timeout)
+            except BaseException:
+                if gate:
+                    gate.leave()
+                raise
+        finally:
+            self._pool.waiting -= 1
+        waited = time.perf_counter() - started
+        POOL_ACQUIRE_WAIT.observe((), waited)
+        timing = request_timing.get()
+        if timing is not None:
+            timing.pool_wait += waited
+        return self._conn
+
+    async def __aexit__(self, exc_type, *exc):
+        try:
+            if exc_type is None and self._pool.on_release:
+                await self._pool.on_release(self._conn)
+        finally:
+            await self._release()
+
+    async def _release(self):
+        try:
+            await self._pool.pool.release(self._conn)
+        finally:
+            if self._pool.gate:
+                self._pool.gate.leave()
+
+
+class TimedPool:
+    """Обёртка над asyncpg.Pool: учитывает ожидание свободного соединения и загрузку пула.
+
+    С ADMISSION_ENABLED соединения выдаются через PriorityGate: по классу
+    приоритета запроса и с ограниченным ожиданием. on_release(conn) вызывается
+    перед возвратом соединения, если блок завершился без ошибки.
+    Остальные методы пула проксируются без изменений.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.waiting = 0
+        self.on_release = None
+        self.gate = PriorityGate(pool.get_max_size()) if ADMISSION_ENABLED else None
+
+    def admit(self, priority: str):
+        """Отказ с 503, если запрос класса priority не дождётся соединения"""
+        if self.gate:
+            self.gate.check(priority)
+
+    def acquire(self, *, timeout: float = None):
+        return _TimedAcquire(self, timeout)
+
+    def collect(self):
+        """Обновление метрик состояния пула (вызывается при выдаче /metrics)"""
+        size, idle, max_size = self.pool.get_size(), self.pool.get_idle_size(), self.pool.get_max_size()
+        POOL_CONNECTIONS.set(("in_use",), size - idle)
+        POOL_CONNECTIONS.set(("idle",), idle)
+        POOL_CONNECTIONS.set(("max",), max_size)
+        POOL_WAITING.set((), self.waiting)
+        POOL_SATURATION.set((), round((size - idle) / max_size, 3) if max_size else 0)
+        if self.gate:
+            self.gate.collect()
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+
+def server_timing(timing: RequestTiming, total_seconds: float) -> str:
+    """Заголовок Server-Timing: ожидание пула, SQL и полное время обработки, мс"""
+    return (f"pool;dur={timing.pool_wait * 1000:.2f}, db;dur={timing.db_time * 1000:.2f}, "
+            f"app;dur={total_seconds * 1000:.2f}")
@@ -0,0 +1,88 @@
+from datetime import date
+
+# Память о закрытых периодах бюджетов: потраченная сумма за период, который
+# уже закончился, больше не пересчитывается. Запись сбрасывается триггером,
+# если задним числом добавлен расход, попадающий в этот период.
+UTILIZATION_SCHEMA = '''
+CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date ON expenses(user_id, category, date);
+
+CREATE TABLE IF NOT EXISTS budget_period_usage (
+    budget_id INTEGER NOT NULL REFERENCES budgets(budget_id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    window_start DATE NOT NULL,
+    window_end DATE NOT NULL,
+    spent DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (budget_id, window_start, window_end)
+);
+CREATE INDEX IF NOT EXISTS idx_budget_period_usage_user_category
+    ON budget_period_usage(user_id, category, window_start);
+'''
+
+UTILIZATION_ROUTINES = '''
+CREATE OR REPLACE FUNCTION expenses_reset_budget_usage() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM budget_period_usage m
+    USING new_rows n
+    WHERE m.user_id = n.user_id
+      AND m.category = n.category
+      AND n.date BETWEEN m.window_start AND m.window_end;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_expenses_reset_budget_usage ON expenses;
+CREATE TRIGGER trg_expenses_reset_budget_usage
+AFTER INSERT ON expenses
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expenses_reset_budget_usage();
+'''
+
+
+async def fetch_utilization(conn, user_id: int, at: date = None):
+    """Исполнение всех бюджетов пользователя за период, содержащий дату at.
+
+    Один запрос: окна периодов, суммы расходов по категориям (или из памяти
+    для закрытых периодов) и запоминание только что посчитанных закрытых.
+    """
+    at = at or date.today()
+    rows = await conn.fetch('''
+    WITH windows AS (
+        SELECT budget_id, category, amount, period,
+               COALESCE(budget_period_start(start_date, period, $2), start_date) AS window_start,
+               COALESCE(
+                   budget_period_end(budget_period_start(start_date, period, $2), period),
+                   end_date,
+                   $2
+               ) AS window_end
+        FROM budgets
+        WHERE user_id = $1
+    ), spent AS (
+        SELECT w.*,
+               m.spent IS NOT NULL AS memoized,
+               COALESCE(m.spent, (
+                   SELECT COALESCE(SUM(e.amount), 0)
+                   FROM expenses e
+                   WHERE e.user_id = $1
+                     AND e.category = w.category
+                     AND e.date BETWEEN w.window_start AND w.window_end
+               )) AS spent
+        FROM windows w
+        LEFT JOIN budget_period_usage m
+               ON m.budget_id = w.budget_id
+              AND m.window_start = w.window_start
+              AND m.window_end = w.window_end
+    ), remembered AS (
+        INSERT INTO budget_period_usage (budget_id, user_id, category, window_start, window_end, spent)
+        SELECT budget_id, $1, category, window_start, window_end, spent
+        FROM spent
+        WHERE NOT memoized AND window_end < CURRENT_DATE
+        ON CONFLICT DO NOTHING
+    )
+    SELECT budget_id, category, period, amount, window_start, window_end, spent,
+           amount - spent AS remaining,
+           round((spent / amount * 100)::numeric, 1)::float AS percent
+    FROM spent
+    ORDER BY budget_id
+    ''', user_id, at)
+    return [dict(row) for row in rows]
@@ -0,0 +1,231 @@
+import os
+import zlib
+from contextvars import ContextVar
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Формат ответа по заголовку Accept: JSON по умолчанию, MessagePack и CBOR —
+# если клиент их просит и установлены пакеты msgpack / cbor2
+WIRE_FORMATS = os.getenv("WIRE_FORMATS", "1") == "1"
+
+# Сжатие ответов по Accept-Encoding (br, gzip); тела меньше порога не сжимаются
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "1") == "1"
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Уровни сжатия: быстрые настройки, выигрыш от более высоких на JSON невелик
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack необязателен: без него application/msgpack не предлагается
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import brotli
+except ImportError:
+    # без brotli клиенты с Accept-Encoding: br получают gzip
+    brotli = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+
+# Синонимы, которые встречаются у клиентских библиотек
+MEDIA_TYPE_ALIASES = {
+    "application/x-msgpack": MSGPACK_MEDIA_TYPE,
+    "application/vnd.msgpack": MSGPACK_MEDIA_TYPE,
+}
+
+# Типы, которые имеет смысл сжимать; SSE не сжимается — события должны уходить сразу
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "application/cbor", "application/x-ndjson", "text/")
+NOT_COMPRESSIBLE_TYPES = ("text/event-stream",)
+
+# Формат ответа текущего запроса; выставляется WireMiddleware до вызова эндпоинта
+response_format: ContextVar[str] = ContextVar("response_format", default=JSON_MEDIA_TYPE)
+
+
+def available_formats() -> list:
+    formats = [JSON_MEDIA_TYPE]
+    if WIRE_FORMATS and msgpack is not None:
+        formats.append(MSGPACK_MEDIA_TYPE)
+    if WIRE_FORMATS and cbor2 is not None:
+        formats.append(CBOR_MEDIA_TYPE)
+    return formats
+
+
+def _parse_qualities(header: str) -> list:
+    """Элементы Accept / Accept-Encoding с весами q, по убыванию веса (порядок при равенстве сохраняется)"""
+    items = []
+    for part in header.split(","):
+        name, *params = part.strip().split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        items.append((name, quality))
+    return sorted(items, key=lambda item: -item[1])
+
+
+def negotiate_format(accept) -> str:
+    """Формат ответа по Accept; неизвестные и подстановочные типы дают JSON"""
+    if not accept:
+        return JSON_MEDIA_TYPE
+    formats = available_formats()
+    for name, quality in _parse_qualities(accept):
+        if quality <= 0:
+            continue
+        name = MEDIA_TYPE_ALIASES.get(name, name)
+        if name in formats:
+            return name
+        if name in ("*/*", "application/*"):
+            return JSON_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def negotiate_encoding(accept_encoding) -> str:
+    """Кодирование ответа по Accept-Encoding: br, gzip или None; при равном весе — br"""
+    if not accept_encoding:
+        return None
+    qualities = dict(reversed(_parse_qualities(accept_encoding)))
+    wildcard = qualities.get("*", 0.0)
+    candidates = [("gzip", qualities.get("gzip", wildcard))]
+    if brotli is not None:
+        candidates.insert(0, ("br", qualities.get("br", wildcard)))
+    name, quality = max(candidates, key=lambda item: item[1])
+    return name if quality > 0 else None
+
+
+def _plain(value, default):
+    """Значения для CBOR: Decimal и даты так же, как в JSON (cbor2 иначе пишет их тегами)"""
+    if isinstance(value, dict):
+        return {key: _plain(item, default) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item, default) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool, bytes)):
+        return value
+    return default(value)
+
+
+def encode(data, media_type: str, default) -> bytes:
+    """Двоичные форматы; default — преобразование Decimal и дат, как у JSON"""
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(data, default=default)
+    if media_type == CBOR_MEDIA_TYPE:
+        return cbor2.dumps(_plain(data, default))
+    raise ValueError(f"Неизвестный формат ответа: {media_type}")
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Часть потока; сбрасывается сразу, чтобы клиент получал строки NDJSON без задержки"""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class WireMiddleware:
+    """Согласование формата (Accept) и сжатия (Accept-Encoding) для всех эндпоинтов.
+
+    Формат кладётся в response_format — по нему ответы кодируются в msgpack/CBOR.
+    Сжатие: целые ответы — от COMPRESS_MIN_SIZE, потоковые — всегда, по частям.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        token = response_format.set(negotiate_format(headers.get("accept")))
+        encoding = negotiate_encoding(headers.get("accept-encoding")) if COMPRESS_ENABLED else None
+        try:
+            await self.app(scope, receive, self._wrap_send(send, encoding))
+        finally:
+            response_format.reset(token)
+
+    @staticmethod
+    def _wrap_send(send, encoding):
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def wrapped(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                if content_type in (MSGPACK_MEDIA_TYPE, CBOR_MEDIA_TYPE, JSON_MEDIA_TYPE) and WIRE_FORMATS:
+                    headers.add_vary_header("Accept")
+
+                compressible = (
+                    encoding is not None
+                    and start["status"] not in (204, 304)
+                    and "content-encoding" not in headers
+                    and content_type.startswith(COMPRESSIBLE_TYPES)
+                    and not content_type.startswith(NOT_COMPRESSIBLE_TYPES)
+                )
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                if not compressible or (not more_body and len(body) < COMPRESS_MIN_SIZE):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            if more_body:
+                await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.finish(body)})
+
+        return wrapped